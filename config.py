@@ -29,6 +29,9 @@ class Settings(BaseSettings):
     # Webhook Configuration
     webhook_port: int = 8081
     webhook_host: str = "0.0.0.0"
+    webhook_max_body_size: int = 1024 * 1024  # 1MB, bigger bodies are rejected with 413
+    webhook_secret: str = ""  # HMAC-SHA256 key for X-Webhook-Signature, empty disables the check
+    webhook_max_concurrent_requests: int = 64  # further requests get 429
     
     # Production Configuration
     environment: str = "development"  # development, staging, production
@@ -37,6 +40,13 @@ class Settings(BaseSettings):
     # Graceful shutdown timeout
     shutdown_timeout: int = 30
     
+    # Update processing: updates from the same chat are always handled in
+    # order; values above 1 let updates from different chats run concurrently
+    max_concurrent_updates: int = 1
+    
+    # Run the event loop on uvloop when it is installed
+    use_uvloop: bool = True
+    
     # File upload limits
     max_file_size_mb: int = 50
     allowed_file_extensions: str = ".stl,.obj,.3mf"
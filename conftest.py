@@ -0,0 +1,186 @@
+"""
+Shared pytest configuration for the Telegram bot test suite.
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, create_autospec
+
+import pytest
+from pytest_asyncio import is_async_test
+# Import python-telegram-bot once before collection so xdist workers and
+# the test modules find it already in sys.modules
+from telegram import CallbackQuery, Chat, Message, Update, User  # noqa: F401
+from telegram.ext import ContextTypes  # noqa: F401
+
+from api_client import APIClient
+from notification_service import NotificationService
+from session_manager import SessionManager
+from webhook_handler import WebhookHandler
+
+try:
+    import uvloop
+except ImportError:  # uvloop is unavailable on Windows
+    uvloop = None
+
+
+def pytest_configure(config):
+    """Keep asyncio debug mode off for the test session"""
+    # Every new event loop enables debug instrumentation of task creation
+    # and callback scheduling when this variable is set
+    os.environ.pop("PYTHONASYNCIODEBUG", None)
+
+
+def pytest_collection_modifyitems(items):
+    """Run every async test in the session-scoped event loop"""
+    session_scope_marker = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_scope_marker, append=False)
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Use uvloop for async tests when it is installed"""
+    if uvloop is not None:
+        return uvloop.EventLoopPolicy()
+    return asyncio.DefaultEventLoopPolicy()
+
+
+# Spec'd mocks keyed by class; introspecting a class for autospec is the
+# expensive part, so each prototype is built once and reset between uses
+_MOCK_PROTOTYPES = {}
+
+
+def get_mock(cls):
+    """Return the shared spec'd mock for cls, reset to a clean state
+    
+    Args:
+        cls: Class to mock
+    
+    Returns:
+        Autospec'd instance mock with calls, return values and side effects cleared
+    """
+    prototype = _MOCK_PROTOTYPES.get(cls)
+    if prototype is None:
+        prototype = create_autospec(cls, instance=True, spec_set=True)
+        _MOCK_PROTOTYPES[cls] = prototype
+    prototype.reset_mock(return_value=True, side_effect=True)
+    return prototype
+
+
+class NotificationServiceStub:
+    """Stand-in for the NotificationService methods the webhook handler calls
+    
+    Calls are recorded as (method name, args, kwargs) tuples in calls; set
+    error to make the next calls raise it.
+    """
+    
+    def __init__(self):
+        self.calls = []
+        self.error = None
+    
+    def reset(self):
+        """Forget recorded calls and the pending error"""
+        self.calls.clear()
+        self.error = None
+    
+    def _record(self, name, args, kwargs):
+        self.calls.append((name, args, kwargs))
+        if self.error is not None:
+            raise self.error
+    
+    async def notify_new_order(self, *args, **kwargs):
+        self._record("notify_new_order", args, kwargs)
+    
+    async def notify_new_orders_batch(self, *args, **kwargs):
+        self._record("notify_new_orders_batch", args, kwargs)
+    
+    async def notify_status_change_by_email(self, *args, **kwargs):
+        self._record("notify_status_change_by_email", args, kwargs)
+    
+    async def send_test_notification(self, *args, **kwargs):
+        self._record("send_test_notification", args, kwargs)
+        return True
+
+
+def make_update(user_id=12345, name="Test User"):
+    """Build a lightweight message update exposing only what the handlers read"""
+    user = SimpleNamespace(id=user_id, first_name=name)
+    message = SimpleNamespace(reply_text=AsyncMock())
+    return SimpleNamespace(
+        effective_user=user,
+        effective_message=message,
+        message=message,
+        callback_query=None
+    )
+
+
+def make_callback_update(user_id=12345, name="Test User", data=None):
+    """Build a lightweight callback query update exposing only what the handlers read"""
+    user = SimpleNamespace(id=user_id, first_name=name)
+    message = SimpleNamespace(reply_text=AsyncMock())
+    callback_query = SimpleNamespace(
+        data=data,
+        from_user=user,
+        message=message,
+        answer=AsyncMock(),
+        edit_message_text=AsyncMock()
+    )
+    return SimpleNamespace(
+        effective_user=user,
+        effective_message=message,
+        message=None,
+        callback_query=callback_query
+    )
+
+
+@pytest.fixture
+def mock_api_client():
+    """Mock API client, reset before each test"""
+    return get_mock(APIClient)
+
+
+@pytest.fixture
+def mock_notification_service():
+    """Mock notification service, reset before each test"""
+    return get_mock(NotificationService)
+
+
+@pytest.fixture
+def mock_session_manager():
+    """Mock session manager, reset before each test"""
+    return get_mock(SessionManager)
+
+
+@pytest.fixture(scope="session")
+def _session_manager():
+    """SessionManager shared by the whole session"""
+    return SessionManager()
+
+
+@pytest.fixture
+def session_manager(_session_manager):
+    """Shared SessionManager, emptied before each test"""
+    _session_manager.clear()
+    return _session_manager
+
+
+@pytest.fixture(scope="session")
+def _webhook_handler():
+    """WebhookHandler built once around a notification service stub"""
+    return WebhookHandler(NotificationServiceStub())
+
+
+@pytest.fixture
+def webhook_handler(_webhook_handler):
+    """Shared webhook handler; its notification service stub, remembered
+    deliveries and pending new order batch are reset before each test"""
+    _webhook_handler.notification_service.reset()
+    _webhook_handler._seen.clear()
+    _webhook_handler._processing.clear()
+    if _webhook_handler._order_flush is not None:
+        _webhook_handler._order_flush.cancel()
+        _webhook_handler._order_flush = None
+    _webhook_handler._pending_orders.clear()
+    return _webhook_handler
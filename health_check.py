@@ -7,12 +7,23 @@ import time
 import psutil
 import os
 from datetime import datetime
+from functools import partial
+import orjson
 from aiohttp import web, ClientSession, ClientTimeout
 from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+def _dumps(data) -> str:
+    """Serialize with orjson; web.json_response expects a str"""
+    return orjson.dumps(data).decode()
+
+
+# JSON responses encoded with orjson instead of the stdlib json module
+_json_response = partial(web.json_response, dumps=_dumps)
+
+
 class HealthCheckServer:
     """Enhanced HTTP server for health checks and monitoring"""
     
@@ -34,7 +45,7 @@ class HealthCheckServer:
     async def health_check(self, request):
         """Basic health check endpoint for Docker/K8s"""
         self.request_count += 1
-        return web.json_response({
+        return _json_response({
             "status": "healthy",
             "service": "nordlayer-telegram-bot",
             "timestamp": datetime.utcnow().isoformat(),
@@ -49,18 +60,18 @@ class HealthCheckServer:
         try:
             process = psutil.Process(os.getpid())
             if process.is_running():
-                return web.json_response({
+                return _json_response({
                     "status": "alive",
                     "timestamp": datetime.utcnow().isoformat()
                 })
             else:
-                return web.json_response({
+                return _json_response({
                     "status": "dead",
                     "timestamp": datetime.utcnow().isoformat()
                 }, status=503)
         except Exception as e:
             logger.error(f"Liveness check failed: {e}")
-            return web.json_response({
+            return _json_response({
                 "status": "error",
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
@@ -74,13 +85,13 @@ class HealthCheckServer:
         api_healthy = await self._check_api_connectivity()
         
         if api_healthy:
-            return web.json_response({
+            return _json_response({
                 "status": "ready",
                 "api_status": "healthy",
                 "timestamp": datetime.utcnow().isoformat()
             })
         else:
-            return web.json_response({
+            return _json_response({
                 "status": "not_ready",
                 "api_status": self.api_status,
                 "timestamp": datetime.utcnow().isoformat()
@@ -129,7 +140,7 @@ class HealthCheckServer:
             }
         }
         
-        return web.json_response(status)
+        return _json_response(status)
     
     async def metrics_check(self, request):
         """Prometheus-style metrics endpoint"""
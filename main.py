@@ -4,13 +4,18 @@ Enhanced with graceful shutdown, production logging, and monitoring.
 """
 import asyncio
 import logging
+import re
 import signal
 import sys
 import os
-from typing import Optional, List, Dict, Any
+import weakref
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Awaitable
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, 
+    BaseUpdateProcessor,
     CommandHandler, 
     MessageHandler, 
     CallbackQueryHandler,
@@ -32,6 +37,61 @@ from webhook_handler import WebhookHandler
 setup_structured_logging()
 logger = logging.getLogger(__name__)
 
+# Basic email validation pattern
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Shorten text to at most limit characters, marking the cut with an ellipsis"""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 3] + "..."
+
+
+@lru_cache(maxsize=1024)
+def _format_order_date(created_at: str) -> str:
+    """Format an order creation timestamp from the API as DD.MM.YYYY
+    
+    Orders are listed repeatedly and often share timestamps, so results are cached.
+    """
+    try:
+        if 'T' in created_at:
+            dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            return dt.strftime('%d.%m.%Y')
+        return created_at[:10]  # Take first 10 chars (YYYY-MM-DD)
+    except ValueError:
+        return created_at[:10]
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates from different chats concurrently, keeping each chat's updates in order"""
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Locks are dropped automatically once no update for the chat is pending
+        self._chat_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Run the handler coroutine, serialized per chat"""
+        chat = getattr(update, 'effective_chat', None)
+        if chat is None:
+            await coroutine
+            return
+        
+        lock = self._chat_locks.get(chat.id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._chat_locks[chat.id] = lock
+        
+        async with lock:
+            await coroutine
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+
 
 class TelegramBot:
     """Main Telegram bot class with API integration"""
@@ -80,7 +140,12 @@ class TelegramBot:
         )
         
         # Initialize Telegram application
-        self.application = Application.builder().token(self.token).build()
+        self.application = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(PerChatUpdateProcessor(settings.max_concurrent_updates))
+            .build()
+        )
         self._setup_handlers()
         
         logger.info("Bot components initialized")
@@ -481,8 +546,8 @@ class TelegramBot:
                 service_description = service.get('description', '')
                 
                 # Truncate description for preview
-                if service_description and len(service_description) > 80:
-                    service_description = service_description[:77] + "..."
+                if service_description:
+                    service_description = _truncate(service_description, 80)
                 
                 message_lines.append(f"{i}. **{service_name}**")
                 if service_description:
@@ -504,7 +569,7 @@ class TelegramBot:
                 service_name = service.get('name', 'Услуга')
                 if service_id:
                     # Truncate button text if too long
-                    button_text = service_name if len(service_name) <= 30 else service_name[:27] + "..."
+                    button_text = _truncate(service_name, 30)
                     keyboard.append([InlineKeyboardButton(
                         f"🛍️ {button_text}", 
                         callback_data=f"select_service_{service_id}"
@@ -904,15 +969,10 @@ class TelegramBot:
             # Format creation date
             date_str = "Дата неизвестна"
             if created_at:
-                try:
-                    from datetime import datetime
-                    if 'T' in created_at:
-                        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                        date_str = dt.strftime('%d.%m.%Y')
-                    else:
-                        date_str = created_at[:10]  # Take first 10 chars (YYYY-MM-DD)
-                except Exception:
-                    date_str = str(created_at)[:10] if created_at else "Дата неизвестна"
+                if isinstance(created_at, str):
+                    date_str = _format_order_date(created_at)
+                else:
+                    date_str = str(created_at)[:10]
             
             # Status emoji
             status_emoji = {
@@ -1064,12 +1124,9 @@ class TelegramBot:
 
     def _validate_email(self, email: str) -> bool:
         """Validate email address format"""
-        import re
         if not email:
             return False
-        # Basic email validation pattern
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email.strip()))
+        return _EMAIL_RE.fullmatch(email.strip()) is not None
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Global error handler"""
@@ -1184,4 +1241,12 @@ async def main():
 
 
 if __name__ == "__main__":
+    # The loop policy has to be set before asyncio.run creates the loop that
+    # the bot, health check and webhook servers all share
+    if settings.use_uvloop:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:  # uvloop is unavailable on Windows
+            logger.warning("uvloop is not installed, using the default event loop")
     asyncio.run(main())
\ No newline at end of file
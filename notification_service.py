@@ -2,7 +2,7 @@
 Notification service for sending alerts about orders and system events.
 """
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from telegram import Bot
 from telegram.error import TelegramError
 
@@ -11,6 +11,16 @@ from subscription_manager import SubscriptionManager
 
 logger = logging.getLogger(__name__)
 
+# Telegram rejects messages longer than this many UTF-16 code units
+_TELEGRAM_MESSAGE_LIMIT = 4096
+# Put between order messages packed into one Telegram message
+_BATCH_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+
+def _utf16_length(text: str) -> int:
+    """Length of text as Telegram counts it; emoji outside the BMP take two units"""
+    return len(text.encode("utf-16-le")) // 2
+
 
 class NotificationService:
     """Service for sending notifications to administrators and users"""
@@ -21,6 +31,56 @@ class NotificationService:
         self.subscription_manager = SubscriptionManager()
         logger.info(f"NotificationService initialized with {len(admin_chat_ids)} admin chats")
     
+    def _format_new_order_message(self, order_data: Dict[str, Any], user_id: int) -> str:
+        """
+        Build the administrator message for a new order
+        
+        Args:
+            order_data: Order information from API response
+            user_id: Telegram user ID who created the order
+        
+        Returns:
+            Markdown message text
+        """
+        order_id = order_data.get('id', 'неизвестен')
+        customer_name = order_data.get('customer_name', 'Не указано')
+        customer_email = order_data.get('customer_email', 'Не указан')
+        customer_phone = order_data.get('customer_phone', 'Не указан')
+        service_name = order_data.get('service_name', 'Не указана')
+        total_price = order_data.get('total_price', 'Не рассчитана')
+        
+        # Extract specifications
+        specs = order_data.get('specifications', {})
+        files_count = len(specs.get('files_info', []))
+        material = specs.get('material', 'Не указан')
+        quality = specs.get('quality', 'Не указано')
+        infill = specs.get('infill', 'Не указано')
+        
+        # Format delivery info
+        delivery_needed = order_data.get('delivery_needed')
+        delivery_info = "Самовывоз"
+        if delivery_needed == "true":
+            delivery_details = order_data.get('delivery_details', 'Адрес не указан')
+            delivery_info = f"Доставка: {delivery_details}"
+        
+        return (
+            "🆕 **Новый заказ из Telegram бота!**\n\n"
+            f"📋 **Заказ #{order_id}**\n"
+            f"👤 Клиент: {customer_name}\n"
+            f"📧 Email: {customer_email}\n"
+            f"📱 Телефон: {customer_phone}\n"
+            f"🛍️ Услуга: {service_name}\n"
+            f"💰 Стоимость: {total_price}\n\n"
+            f"⚙️ **Параметры печати:**\n"
+            f"🔹 Материал: {material}\n"
+            f"🔹 Качество: {quality}\n"
+            f"🔹 Заполнение: {infill}%\n"
+            f"📁 Файлов: {files_count}\n\n"
+            f"🚚 **Доставка:** {delivery_info}\n\n"
+            f"🤖 Источник: Telegram Bot (User ID: {user_id})\n"
+            f"⏰ Требует обработки в админ-панели"
+        )
+    
     async def notify_new_order(self, order_data: Dict[str, Any], user_id: int):
         """
         Notify administrators about a new order
@@ -30,44 +90,7 @@ class NotificationService:
             user_id: Telegram user ID who created the order
         """
         try:
-            order_id = order_data.get('id', 'неизвестен')
-            customer_name = order_data.get('customer_name', 'Не указано')
-            customer_email = order_data.get('customer_email', 'Не указан')
-            customer_phone = order_data.get('customer_phone', 'Не указан')
-            service_name = order_data.get('service_name', 'Не указана')
-            total_price = order_data.get('total_price', 'Не рассчитана')
-            
-            # Extract specifications
-            specs = order_data.get('specifications', {})
-            files_count = len(specs.get('files_info', []))
-            material = specs.get('material', 'Не указан')
-            quality = specs.get('quality', 'Не указано')
-            infill = specs.get('infill', 'Не указано')
-            
-            # Format delivery info
-            delivery_needed = order_data.get('delivery_needed')
-            delivery_info = "Самовывоз"
-            if delivery_needed == "true":
-                delivery_details = order_data.get('delivery_details', 'Адрес не указан')
-                delivery_info = f"Доставка: {delivery_details}"
-            
-            message = (
-                "🆕 **Новый заказ из Telegram бота!**\n\n"
-                f"📋 **Заказ #{order_id}**\n"
-                f"👤 Клиент: {customer_name}\n"
-                f"📧 Email: {customer_email}\n"
-                f"📱 Телефон: {customer_phone}\n"
-                f"🛍️ Услуга: {service_name}\n"
-                f"💰 Стоимость: {total_price}\n\n"
-                f"⚙️ **Параметры печати:**\n"
-                f"🔹 Материал: {material}\n"
-                f"🔹 Качество: {quality}\n"
-                f"🔹 Заполнение: {infill}%\n"
-                f"📁 Файлов: {files_count}\n\n"
-                f"🚚 **Доставка:** {delivery_info}\n\n"
-                f"🤖 Источник: Telegram Bot (User ID: {user_id})\n"
-                f"⏰ Требует обработки в админ-панели"
-            )
+            message = self._format_new_order_message(order_data, user_id)
             
             # Send to all admin chats
             for admin_id in self.admin_chat_ids:
@@ -86,6 +109,90 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error in notify_new_order: {e}")
     
+    async def notify_new_orders_batch(self, orders: List[Tuple[Dict[str, Any], int]]):
+        """
+        Notify administrators about several new orders at once
+        
+        Order messages are packed into as few Telegram messages as the
+        message length limit allows, so each admin gets one send per pack
+        instead of one per order. If a pack cannot be sent, its orders are
+        sent to that admin one at a time instead.
+        
+        Args:
+            orders: (order_data, user_id) pairs, in arrival order
+        """
+        if len(orders) == 1:
+            await self.notify_new_order(*orders[0])
+            return
+        
+        try:
+            packs = self._pack_order_messages(orders)
+            
+            # Send to all admin chats
+            for admin_id in self.admin_chat_ids:
+                sent = 0
+                for text, messages in packs:
+                    if await self._send_admin_message(admin_id, text):
+                        sent += len(messages)
+                    elif len(messages) > 1:
+                        for message in messages:
+                            sent += await self._send_admin_message(admin_id, message)
+                logger.info(f"{sent} of {len(orders)} new order notifications sent to admin {admin_id}")
+        
+        except Exception as e:
+            logger.error(f"Error in notify_new_orders_batch: {e}")
+    
+    def _pack_order_messages(self, orders: List[Tuple[Dict[str, Any], int]]) -> List[Tuple[str, List[str]]]:
+        """
+        Pack new order messages into texts within the Telegram length limit
+        
+        Args:
+            orders: (order_data, user_id) pairs, in arrival order
+        
+        Returns:
+            (packed text, order messages in it) pairs
+        """
+        separator_length = _utf16_length(_BATCH_SEPARATOR)
+        packs = []
+        messages = []
+        length = 0
+        for order_data, user_id in orders:
+            message = self._format_new_order_message(order_data, user_id)
+            message_length = _utf16_length(message)
+            if messages and length + separator_length + message_length > _TELEGRAM_MESSAGE_LIMIT:
+                packs.append((_BATCH_SEPARATOR.join(messages), messages))
+                messages = []
+                length = 0
+            length += separator_length + message_length if messages else message_length
+            messages.append(message)
+        if messages:
+            packs.append((_BATCH_SEPARATOR.join(messages), messages))
+        return packs
+    
+    async def _send_admin_message(self, admin_id: int, text: str) -> bool:
+        """
+        Send a Markdown message to one admin chat
+        
+        Args:
+            admin_id: Admin chat ID
+            text: Message text
+        
+        Returns:
+            True if the message was sent
+        """
+        try:
+            await self.bot.send_message(
+                chat_id=admin_id, 
+                text=text,
+                parse_mode='Markdown'
+            )
+            return True
+        except TelegramError as e:
+            logger.error(f"Failed to notify admin {admin_id} about new orders: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error notifying admin {admin_id}: {e}")
+        return False
+    
     async def notify_status_change(self, user_id: int, order_data: Dict[str, Any]):
         """
         Notify user about order status change
@@ -2,7 +2,7 @@
 Session management for Telegram bot user states and order processing.
 """
 import logging
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from enum import Enum
 from typing import Dict, List, Optional, Any
 import json
@@ -120,6 +120,10 @@ class OrderSession:
         return "\n".join(summary_lines)
 
 
+# Names update_session may assign; methods are excluded
+_ORDER_SESSION_FIELDS = frozenset(f.name for f in fields(OrderSession))
+
+
 class SessionManager:
     """Manager for user sessions and order states"""
     
@@ -183,7 +187,7 @@ class SessionManager:
         session = self.get_session(user_id)
         if session:
             for key, value in kwargs.items():
-                if hasattr(session, key):
+                if key in _ORDER_SESSION_FIELDS:
                     setattr(session, key, value)
                     logger.debug(f"Updated session {user_id}: {key} = {value}")
                 else:
@@ -207,6 +211,11 @@ class SessionManager:
             return True
         return False
     
+    def clear(self):
+        """Drop all sessions"""
+        self.sessions.clear()
+        logger.debug("Cleared all sessions")
+    
     def reset_session_step(self, user_id: int, step: OrderStep) -> Optional[OrderSession]:
         """
         Reset session to specific step
@@ -40,6 +40,7 @@ class TestBotIntegration:
             mock_settings.api_timeout = 30
             mock_settings.log_level = "INFO"
             mock_settings.log_file = "test.log"
+            mock_settings.max_concurrent_updates = 1
             
             bot = TelegramBot()
             
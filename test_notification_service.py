@@ -0,0 +1,90 @@
+"""
+Tests for the notification service.
+"""
+import pytest
+from unittest.mock import AsyncMock, call, patch
+
+from telegram.error import BadRequest
+
+from notification_service import (
+    NotificationService, _BATCH_SEPARATOR, _TELEGRAM_MESSAGE_LIMIT, _utf16_length
+)
+
+
+ADMIN_CHAT_IDS = [111, 222]
+
+
+def _order(order_id, **fields):
+    """(order_data, user_id) pair for a new order"""
+    return {"id": order_id, "customer_name": "Test Customer", **fields}, 456789
+
+
+# Emoji outside the BMP count as two UTF-16 units towards Telegram's limit,
+# so these pack differently than a code point count would suggest
+EMOJI_ORDERS = [_order(order_id, customer_name="😀" * 700) for order_id in range(8)]
+
+
+@pytest.fixture
+def notification_service():
+    """Notification service with a mocked bot"""
+    with patch("notification_service.Bot"), patch("notification_service.SubscriptionManager"):
+        service = NotificationService("test_token", ADMIN_CHAT_IDS)
+    service.bot.send_message = AsyncMock()
+    return service
+
+
+class TestNewOrdersBatch:
+    """Tests for batched new order notifications"""
+    
+    def test_pack_small_batch_into_one_message(self, notification_service):
+        """Test that a few orders share a single message"""
+        packs = notification_service._pack_order_messages([_order(1), _order(2), _order(3)])
+        
+        assert len(packs) == 1
+        text, messages = packs[0]
+        assert len(messages) == 3
+        assert text == _BATCH_SEPARATOR.join(messages)
+    
+    def test_pack_splits_at_utf16_limit(self, notification_service):
+        """Test that packs stay within the limit as Telegram counts it"""
+        packs = notification_service._pack_order_messages(EMOJI_ORDERS)
+        
+        assert len(packs) > 1
+        for text, messages in packs:
+            assert text == _BATCH_SEPARATOR.join(messages)
+            assert _utf16_length(text) <= _TELEGRAM_MESSAGE_LIMIT
+        assert [message for _, messages in packs for message in messages] == [
+            notification_service._format_new_order_message(*order) for order in EMOJI_ORDERS
+        ]
+    
+    async def test_single_order_sends_plain_message(self, notification_service):
+        """Test that a batch of one is sent as a regular new order message"""
+        order = _order(1)
+        
+        await notification_service.notify_new_orders_batch([order])
+        
+        text = notification_service._format_new_order_message(*order)
+        assert notification_service.bot.send_message.await_args_list == [
+            call(chat_id=admin_id, text=text, parse_mode='Markdown') for admin_id in ADMIN_CHAT_IDS
+        ]
+    
+    async def test_failed_pack_falls_back_to_single_orders(self, notification_service):
+        """Test that a failing pack is resent order by order without affecting the other packs"""
+        packs = notification_service._pack_order_messages(EMOJI_ORDERS)
+        failed_text, failed_messages = packs[0]
+        
+        async def send_message(chat_id, text, parse_mode):
+            # The first order of the failed pack cannot be sent on its own either
+            if text in (failed_text, failed_messages[0]):
+                raise BadRequest("Can't parse entities")
+        
+        notification_service.bot.send_message.side_effect = send_message
+        
+        await notification_service.notify_new_orders_batch(EMOJI_ORDERS)
+        
+        texts_per_admin = [failed_text, *failed_messages, *(text for text, _ in packs[1:])]
+        assert notification_service.bot.send_message.await_args_list == [
+            call(chat_id=admin_id, text=text, parse_mode='Markdown')
+            for admin_id in ADMIN_CHAT_IDS
+            for text in texts_per_admin
+        ]
@@ -3,84 +3,104 @@ Integration tests for the complete order creation flow from service selection to
 """
 import pytest
 import asyncio
+from types import MappingProxyType
 from unittest.mock import AsyncMock, MagicMock, patch
-from telegram import Update, User, Message, CallbackQuery, Document
+from telegram import Update, User, Message, CallbackQuery
 from telegram.ext import ContextTypes
 
-from session_manager import SessionManager, OrderSession, OrderStep
-from api_client import APIClient, APIClientError
+from session_manager import OrderSession, OrderStep
+from api_client import APIClientError
 from order_handlers import OrderHandlers
-from notification_service import NotificationService
 
 # Configure pytest-asyncio
 pytest_plugins = ('pytest_asyncio',)
 
+# Read-only API responses shared by every test; MappingProxyType catches
+# accidental mutation by the code under test
+_SERVICES = (
+    MappingProxyType({
+        "id": 1,
+        "name": "FDM печать",
+        "description": "Стандартная 3D печать пластиком",
+        "category": "printing"
+    }),
+    MappingProxyType({
+        "id": 2,
+        "name": "SLA печать",
+        "description": "Высокоточная печать смолой",
+        "category": "printing"
+    })
+)
+
+_UPLOAD_OK = MappingProxyType({
+    "success": True,
+    "file_id": "test_file_123",
+    "file_url": "/uploads/test_file_123.stl"
+})
+
+_CREATE_OK = MappingProxyType({
+    "success": True,
+    "data": MappingProxyType({
+        "id": 42,
+        "customer_name": "Тест Тестов",
+        "customer_email": "test@example.com",
+        "service_name": "FDM печать",
+        "status": "new",
+        "specifications": MappingProxyType({
+            "material": "pla",
+            "quality": "standard",
+            "infill": "30"
+        })
+    })
+})
+
 
 class TestOrderIntegration:
     """Integration tests for complete order flow"""
     
     @pytest.fixture
-    def mock_api_client(self):
+    def mock_api_client(self, mock_api_client):
         """Mock API client with typical responses"""
-        api_client = AsyncMock(spec=APIClient)
+        api_client = mock_api_client
         
         # Mock services response
-        api_client.get_services.return_value = [
-            {
-                "id": 1,
-                "name": "FDM печать",
-                "description": "Стандартная 3D печать пластиком",
-                "category": "printing"
-            },
-            {
-                "id": 2,
-                "name": "SLA печать",
-                "description": "Высокоточная печать смолой",
-                "category": "printing"
-            }
-        ]
+        api_client.get_services.return_value = _SERVICES
         
-        # Mock file upload response
-        api_client.upload_file.return_value = {
-            "success": True,
-            "file_id": "test_file_123",
-            "file_url": "/uploads/test_file_123.stl"
-        }
+        # Mock file upload response; size limits are tested via file_size
+        # attributes, so a real multi-MB payload must never reach the stub
+        async def upload_file(file_data, filename, content_type=None):
+            assert len(file_data) < 4096, "tests must not allocate real payloads"
+            return _UPLOAD_OK
         
-        # Mock order creation response
-        api_client.create_order.return_value = {
-            "success": True,
-            "data": {
-                "id": 42,
-                "customer_name": "Тест Тестов",
-                "customer_email": "test@example.com",
-                "service_name": "FDM печать",
-                "status": "new",
-                "specifications": {
-                    "material": "pla",
-                    "quality": "standard",
-                    "infill": "30"
-                }
-            }
-        }
+        api_client.upload_file.side_effect = upload_file
+        
+        # confirm_order checks isinstance(..., dict) on the response envelope
+        api_client.create_order.return_value = dict(_CREATE_OK)
         
         return api_client
     
-    @pytest.fixture
-    def session_manager(self):
-        """Session manager instance"""
-        return SessionManager()
-    
-    @pytest.fixture
-    def mock_notification_service(self):
-        """Mock notification service"""
-        return AsyncMock(spec=NotificationService)
-    
     @pytest.fixture
     def order_handlers(self, mock_api_client, session_manager, mock_notification_service):
         """Order handlers with mocked dependencies"""
         return OrderHandlers(mock_api_client, session_manager, mock_notification_service)
     
+    @pytest.fixture
+    def complete_session_at(self, session_manager):
+        """Factory building a fully populated session at a given step"""
+        def _make(user_id, step, **overrides):
+            fields = {
+                "service_id": 1,
+                "service_name": "FDM печать",
+                "customer_name": "Тест Тестов",
+                "customer_email": "test@example.com",
+                "files": [{"filename": "test.stl", "size": 1024}],
+                "specifications": {"material": "pla", "quality": "standard", "infill": "30"},
+                "delivery_needed": False,
+                **overrides
+            }
+            return self._seeded_session(session_manager, user_id, step, **fields)
+        return _make
+    
     @pytest.fixture
     def mock_update(self):
         """Mock Telegram update object"""
@@ -106,127 +126,88 @@ class TestOrderIntegration:
         context.bot.get_file = AsyncMock()
         return context
     
+    @staticmethod
+    def _seeded_session(session_manager, user_id, step, **overrides):
+        """Create a session already at the given step with the supplied fields"""
+        session = session_manager.create_session(user_id)
+        session.step = step
+        for key, value in overrides.items():
+            setattr(session, key, value)
+        return session
+    
     @pytest.mark.asyncio
-    async def test_complete_order_flow_success(self, order_handlers, mock_update, mock_context, mock_api_client, mock_notification_service):
-        """Test complete successful order flow from start to finish"""
-        user_id = 12345
-        
-        # Step 1: Start order process
+    async def test_start_order_process_creates_session(self, order_handlers, mock_update, mock_context):
+        """Test starting the order process moves the user to service selection"""
         await order_handlers.start_order_process(mock_update, mock_context)
         
-        # Verify session was created
-        session = order_handlers.session_manager.get_session(user_id)
+        session = order_handlers.session_manager.get_session(12345)
         assert session is not None
         assert session.step == OrderStep.SERVICE_SELECTION
+    
+    @pytest.mark.asyncio
+    async def test_handle_service_selection_advances_step(self, order_handlers, mock_update, mock_context):
+        """Test selecting a service stores it and moves to contact info"""
+        self._seeded_session(order_handlers.session_manager, 12345, OrderStep.SERVICE_SELECTION)
         
-        # Step 2: Select service
         await order_handlers.handle_service_selection(mock_update, mock_context, service_id=1)
         
-        # Verify service was selected
-        session = order_handlers.session_manager.get_session(user_id)
+        session = order_handlers.session_manager.get_session(12345)
         assert session.service_id == 1
         assert session.service_name == "FDM печать"
         assert session.step == OrderStep.CONTACT_INFO
+    
+    @pytest.mark.asyncio
+    async def test_confirm_order_sends_order_data(self, order_handlers, mock_update, mock_context, mock_api_client, mock_notification_service, complete_session_at):
+        """Test confirming a complete order sends the expected payload"""
+        complete_session_at(12345, OrderStep.CONFIRMATION, customer_phone="+7 900 123-45-67")
         
-        # Step 3: Enter contact information
-        await order_handlers.handle_contact_name(mock_update, mock_context, "Тест Тестов")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.customer_name == "Тест Тестов"
-        
-        await order_handlers.handle_contact_email(mock_update, mock_context, "test@example.com")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.customer_email == "test@example.com"
-        
-        await order_handlers.handle_contact_phone(mock_update, mock_context, "+7 900 123-45-67")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.customer_phone == "+7 900 123-45-67"
-        assert session.step == OrderStep.FILE_UPLOAD
-        
-        # Step 4: Upload file
-        mock_file = MagicMock(spec=Document)
-        mock_file.file_name = "test_model.stl"
-        mock_file.file_size = 1024 * 1024  # 1MB
-        mock_file.file_id = "telegram_file_123"
-        mock_file.mime_type = "application/octet-stream"
-        
-        mock_update.message.document = mock_file
-        mock_context.bot.get_file.return_value.download_as_bytearray = AsyncMock(return_value=b"fake_stl_data")
-        
-        await order_handlers.handle_file_upload(mock_update, mock_context)
-        
-        # Verify file was uploaded
-        session = order_handlers.session_manager.get_session(user_id)
-        assert len(session.files) == 1
-        assert session.files[0]["filename"] == "test_model.stl"
-        mock_api_client.upload_file.assert_called_once()
-        
-        # Step 5: Continue to specifications
-        await order_handlers.continue_with_files(mock_update, mock_context)
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.step == OrderStep.SPECIFICATIONS
-        
-        # Step 6: Select specifications
-        await order_handlers.handle_material_selection(mock_update, mock_context, "pla")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.specifications["material"] == "pla"
-        
-        await order_handlers.handle_quality_selection(mock_update, mock_context, "standard")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.specifications["quality"] == "standard"
-        
-        await order_handlers.handle_infill_selection(mock_update, mock_context, "30")
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.specifications["infill"] == "30"
-        assert session.step == OrderStep.DELIVERY
-        
-        # Step 7: Select delivery
-        await order_handlers.handle_delivery_pickup(mock_update, mock_context)
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session.delivery_needed == False
-        assert session.step == OrderStep.CONFIRMATION
-        
-        # Step 8: Confirm order
         await order_handlers.confirm_order(mock_update, mock_context)
         
-        # Verify order was created
         mock_api_client.create_order.assert_called_once()
+        (order_data,), _ = mock_api_client.create_order.await_args
+        assert order_data["customer_name"] == "Тест Тестов"
+        assert order_data["customer_email"] == "test@example.com"
+        assert order_data["customer_phone"] == "+7 900 123-45-67"
+        assert order_data["service_id"] == 1
+        assert order_data["source"] == "TELEGRAM"
+        assert order_data["delivery_needed"] == "false"
+        assert order_data["specifications"]["material"] == "pla"
+        assert order_data["specifications"]["quality"] == "standard"
+        assert order_data["specifications"]["infill"] == "30"
+        assert len(order_data["specifications"]["files_info"]) == 1
         
-        # Verify order data format
-        call_args = mock_api_client.create_order.call_args[0][0]
-        assert call_args["customer_name"] == "Тест Тестов"
-        assert call_args["customer_email"] == "test@example.com"
-        assert call_args["customer_phone"] == "+7 900 123-45-67"
-        assert call_args["service_id"] == 1
-        assert call_args["source"] == "TELEGRAM"
-        assert call_args["delivery_needed"] == "false"
-        assert "specifications" in call_args
-        assert call_args["specifications"]["material"] == "pla"
-        assert call_args["specifications"]["quality"] == "standard"
-        assert call_args["specifications"]["infill"] == "30"
-        assert len(call_args["specifications"]["files_info"]) == 1
-        
-        # Verify notification was sent
         mock_notification_service.notify_new_order.assert_called_once()
-        
-        # Verify session was cleared
-        session = order_handlers.session_manager.get_session(user_id)
-        assert session is None
     
     @pytest.mark.asyncio
-    async def test_order_creation_api_error_handling(self, order_handlers, mock_update, mock_context, mock_api_client):
-        """Test error handling during order creation"""
-        user_id = 12345
+    async def test_complete_order_flow_smoke(self, order_handlers, mock_update, mock_context, mock_api_client):
+        """Smoke test of the order flow from start to a created order"""
+        await order_handlers.start_order_process(mock_update, mock_context)
+        await order_handlers.handle_service_selection(mock_update, mock_context, service_id=1)
         
-        # Create a complete session
-        session = order_handlers.session_manager.create_session(user_id)
-        session.step = OrderStep.CONFIRMATION
-        session.service_id = 1
-        session.service_name = "FDM печать"
+        # OrderHandlers has no handlers for the contact, file, specification
+        # and delivery steps, so the conversation's answers are filled in here
+        session = order_handlers.session_manager.get_session(12345)
         session.customer_name = "Тест Тестов"
         session.customer_email = "test@example.com"
+        session.customer_phone = "+7 900 123-45-67"
         session.files = [{"filename": "test.stl", "size": 1024}]
         session.specifications = {"material": "pla", "quality": "standard", "infill": "30"}
         session.delivery_needed = False
+        session.step = OrderStep.CONFIRMATION
+        
+        await order_handlers.confirm_order(mock_update, mock_context)
+        
+        assert mock_api_client.create_order.call_count == 1
+        (order_data,), _ = mock_api_client.create_order.await_args
+        assert order_data["service_id"] == 1
+        assert order_data["customer_email"] == "test@example.com"
+        assert order_handlers.session_manager.get_session(12345) is None
+    
+    @pytest.mark.asyncio
+    async def test_order_creation_api_error_handling(self, order_handlers, mock_update, mock_context, mock_api_client, complete_session_at):
+        """Test error handling during order creation"""
+        user_id = 12345
+        complete_session_at(user_id, OrderStep.CONFIRMATION)
         
         # Mock API error
         mock_api_client.create_order.side_effect = APIClientError("Server error", status_code=500)
@@ -243,17 +224,19 @@ class TestOrderIntegration:
         assert session.step == OrderStep.CONFIRMATION
     
     @pytest.mark.asyncio
-    async def test_order_data_validation(self, order_handlers, mock_update, mock_context):
+    async def test_order_data_validation(self, order_handlers, mock_update, mock_context, complete_session_at):
         """Test order data validation before API call"""
         user_id = 12345
         
-        # Create incomplete session
-        session = order_handlers.session_manager.create_session(user_id)
-        session.step = OrderStep.CONFIRMATION
-        session.service_id = 1
-        session.customer_name = "T"  # Too short
-        session.customer_email = "invalid-email"  # Invalid format
-        # Missing files and specifications
+        # Create incomplete session: name too short, invalid email,
+        # missing files and specifications
+        complete_session_at(
+            user_id, OrderStep.CONFIRMATION,
+            customer_name="T",
+            customer_email="invalid-email",
+            files=[],
+            specifications={}
+        )
         
         # Attempt to confirm order
         await order_handlers.confirm_order(mock_update, mock_context)
@@ -313,60 +296,10 @@ class TestOrderIntegration:
         assert order_data["customer_contact"] == "test@example.com"
     
     @pytest.mark.asyncio
-    async def test_file_upload_validation(self, order_handlers, mock_update, mock_context):
-        """Test file upload validation"""
-        user_id = 12345
-        
-        # Create session in file upload step
-        session = order_handlers.session_manager.create_session(user_id)
-        session.step = OrderStep.FILE_UPLOAD
-        session.service_id = 1
-        session.customer_name = "Тест Тестов"
-        session.customer_email = "test@example.com"
-        
-        # Test invalid file format
-        mock_file = MagicMock(spec=Document)
-        mock_file.file_name = "test_model.txt"  # Invalid format
-        mock_file.file_size = 1024
-        mock_update.message.document = mock_file
-        
-        await order_handlers.handle_file_upload(mock_update, mock_context)
-        
-        # Verify error message was sent
-        mock_update.message.reply_text.assert_called()
-        
-        # Verify file was not added to session
-        session = order_handlers.session_manager.get_session(user_id)
-        assert len(session.files) == 0
-        
-        # Test file too large
-        mock_file.file_name = "test_model.stl"  # Valid format
-        mock_file.file_size = 60 * 1024 * 1024  # 60MB - too large
-        
-        await order_handlers.handle_file_upload(mock_update, mock_context)
-        
-        # Verify error message was sent
-        assert mock_update.message.reply_text.call_count >= 2
-        
-        # Verify file was not added to session
-        session = order_handlers.session_manager.get_session(user_id)
-        assert len(session.files) == 0
-    
-    @pytest.mark.asyncio
-    async def test_session_cleanup_after_successful_order(self, order_handlers, mock_update, mock_context, mock_api_client):
+    async def test_session_cleanup_after_successful_order(self, order_handlers, mock_update, mock_context, mock_api_client, complete_session_at):
         """Test that session is properly cleaned up after successful order creation"""
         user_id = 12345
-        
-        # Create complete session
-        session = order_handlers.session_manager.create_session(user_id)
-        session.step = OrderStep.CONFIRMATION
-        session.service_id = 1
-        session.service_name = "FDM печать"
-        session.customer_name = "Тест Тестов"
-        session.customer_email = "test@example.com"
-        session.files = [{"filename": "test.stl", "size": 1024}]
-        session.specifications = {"material": "pla", "quality": "standard", "infill": "30"}
-        session.delivery_needed = False
+        complete_session_at(user_id, OrderStep.CONFIRMATION)
         
         # Confirm order
         await order_handlers.confirm_order(mock_update, mock_context)
@@ -1,13 +1,6 @@
 """
-Test script for order process functionality.
+Tests for order process functionality.
 """
-import asyncio
-import sys
-import os
-
-# Add the telegram-bot directory to the path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
 from session_manager import SessionManager, OrderStep, OrderSession
 from order_handlers import OrderHandlers
 from api_client import APIClient
@@ -157,31 +150,3 @@ def test_order_step_flow():
     
     print("✅ All order step flow tests passed!")
 
-
-async def main():
-    """Run all tests"""
-    print("🧪 Starting order process tests...\n")
-    
-    try:
-        await test_session_management()
-        test_validation_functions()
-        test_order_step_flow()
-        
-        print("\n🎉 All tests passed successfully!")
-        print("\n📋 Order process implementation summary:")
-        print("✅ State machine with OrderStep enum implemented")
-        print("✅ Contact information collection with validation")
-        print("✅ File upload handling with format and size checks")
-        print("✅ Printing specifications selection via inline keyboards")
-        print("✅ Optional delivery address collection")
-        print("✅ Order confirmation with full summary")
-        print("✅ Navigation between steps for editing")
-        print("✅ Session management and cleanup")
-        
-    except Exception as e:
-        print(f"❌ Test failed: {e}")
-        sys.exit(1)
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
@@ -3,72 +3,83 @@ Tests for order tracking functionality in the Telegram bot.
 """
 import pytest
 import asyncio
-from unittest.mock import AsyncMock, MagicMock, patch
-from telegram import Update, User, Message, CallbackQuery, Chat
-from telegram.ext import ContextTypes
+from contextlib import ExitStack
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import AsyncMock, patch
 
 from api_client import APIClient, APIClientError
-from main import TelegramBot
-from session_manager import SessionManager
-from notification_service import NotificationService
+from conftest import make_callback_update, make_update
+from error_handler import BotErrorHandler
+from main import PerChatUpdateProcessor, TelegramBot, _format_order_date
+
+
+_ORDER_1 = MappingProxyType({
+    'id': 1,
+    'status': 'new',
+    'service_name': 'FDM Printing',
+    'created_at': '2024-01-15T10:00:00Z',
+    'customer_name': 'Test User'
+})
+_ORDER_2 = MappingProxyType({
+    'id': 2,
+    'status': 'in_progress',
+    'service_name': 'SLA Printing',
+    'created_at': '2024-01-10T15:30:00Z',
+    'customer_name': 'Test User'
+})
+MOCK_ORDERS = (_ORDER_1, _ORDER_2)
+
+# Markers expected in the orders list for MOCK_ORDERS and test@example.com
+ORDERS_LIST_MARKERS = ("Ваши заказы (2)", "test@example.com", "Заказ #1", "Заказ #2")
+ORDER_DETAIL_CALLBACKS = frozenset(f"order_details_{order['id']}" for order in MOCK_ORDERS)
+
+EMAIL_CASES = (
+    # Valid emails
+    ("test@example.com", True),
+    ("user.name@domain.co.uk", True),
+    ("test+tag@example.org", True),
+    # Invalid emails
+    ("", False),
+    ("invalid-email", False),
+    ("@example.com", False),
+    ("test@", False),
+    ("test.example.com", False),
+)
+
+ORDER_DATE_CASES = (
+    ("2024-01-15T10:00:00Z", "15.01.2024"),
+    ("2024-01-20T15:30:00+03:00", "20.01.2024"),
+    ("2024-01-15", "2024-01-15"),
+    ("not-a-dateT", "not-a-date"),
+)
 
 
 class TestOrderTracking:
     """Test cases for order tracking functionality"""
     
     @pytest.fixture
-    def mock_api_client(self):
-        """Mock API client for testing"""
-        client = AsyncMock(spec=APIClient)
-        return client
-    
-    @pytest.fixture
-    def mock_notification_service(self):
-        """Mock notification service for testing"""
-        service = AsyncMock(spec=NotificationService)
-        return service
-    
-    @pytest.fixture
-    def telegram_bot(self, mock_api_client, mock_notification_service):
+    def telegram_bot(self, mock_api_client, mock_notification_service, session_manager):
         """Create telegram bot instance for testing"""
         bot = TelegramBot()
         bot.api_client = mock_api_client
         bot.notification_service = mock_notification_service
-        bot.session_manager = SessionManager()
+        bot.session_manager = session_manager
         return bot
     
     @pytest.fixture
     def mock_update(self):
         """Create mock telegram update"""
-        update = MagicMock(spec=Update)
-        update.effective_user = MagicMock(spec=User)
-        update.effective_user.id = 12345
-        update.effective_user.first_name = "Test User"
-        update.message = MagicMock(spec=Message)
-        update.message.reply_text = AsyncMock()
-        update.callback_query = None
-        return update
+        return make_update()
     
     @pytest.fixture
     def mock_callback_update(self):
         """Create mock telegram callback update"""
-        update = MagicMock(spec=Update)
-        update.effective_user = MagicMock(spec=User)
-        update.effective_user.id = 12345
-        update.effective_user.first_name = "Test User"
-        update.callback_query = MagicMock(spec=CallbackQuery)
-        update.callback_query.answer = AsyncMock()
-        update.callback_query.edit_message_text = AsyncMock()
-        update.callback_query.message = MagicMock(spec=Message)
-        update.callback_query.message.reply_text = AsyncMock()
-        return update
+        return make_callback_update()
     
     @pytest.fixture
     def mock_context(self):
         """Create mock context"""
-        context = MagicMock(spec=ContextTypes.DEFAULT_TYPE)
-        context.user_data = {}
-        return context
+        return SimpleNamespace(user_data={})
     
     @pytest.mark.asyncio
     async def test_start_order_tracking(self, telegram_bot, mock_update, mock_context):
@@ -80,164 +91,93 @@ class TestOrderTracking:
         
         # Check that message was sent
         mock_update.message.reply_text.assert_called_once()
-        call_args = mock_update.message.reply_text.call_args
-        assert "Отслеживание заказов" in call_args[0][0]
+        (message_text,), _ = mock_update.message.reply_text.await_args
+        assert "Отслеживание заказов" in message_text
     
     @pytest.mark.asyncio
-    async def test_handle_tracking_email_valid(self, telegram_bot, mock_update, mock_context):
-        """Test handling valid email for tracking"""
-        # Setup
+    @pytest.mark.parametrize(
+        "email, api_return, api_side_effect, expect_state_cleared, expect_text, expect_api_called",
+        [
+            ("test@example.com", MOCK_ORDERS, None, True, "Ваши заказы (2)", True),
+            ("invalid-email", None, None, False, "Некорректный email", False),
+            ("noorders@example.com", [], None, True, "Заказы не найдены", True),
+            ("test@example.com", None, APIClientError("API Error", 500), True, None, True),
+        ],
+        ids=["valid", "invalid", "no_orders", "api_error"]
+    )
+    async def test_handle_tracking_email(self, telegram_bot, mock_update, mock_context, monkeypatch, email, api_return,
+                                         api_side_effect, expect_state_cleared, expect_text, expect_api_called):
+        """Test handling email input for tracking"""
         mock_context.user_data['tracking_state'] = 'waiting_for_email'
-        test_email = "test@example.com"
         
-        # Mock API response with orders
-        mock_orders = [
-            {
-                'id': 1,
-                'status': 'new',
-                'service_name': 'FDM Printing',
-                'created_at': '2024-01-15T10:00:00Z',
-                'customer_name': 'Test User'
-            },
-            {
-                'id': 2,
-                'status': 'in_progress',
-                'service_name': 'SLA Printing',
-                'created_at': '2024-01-10T15:30:00Z',
-                'customer_name': 'Test User'
-            }
-        ]
-        telegram_bot.api_client.get_orders_by_email.return_value = mock_orders
+        # Mock API response
+        telegram_bot.api_client.get_orders_by_email.return_value = api_return
+        telegram_bot.api_client.get_orders_by_email.side_effect = api_side_effect
         
         # Mock loading message
         loading_message = AsyncMock()
-        loading_message.delete = AsyncMock()
         mock_update.message.reply_text.return_value = loading_message
         
-        await telegram_bot.handle_tracking_email(mock_update, mock_context, test_email)
-        
-        # Verify API was called with correct email
-        telegram_bot.api_client.get_orders_by_email.assert_called_once_with(test_email)
+        mock_error_handler = AsyncMock()
+        monkeypatch.setattr(BotErrorHandler, 'handle_api_error', mock_error_handler)
         
-        # Verify tracking state was cleared
-        assert 'tracking_state' not in mock_context.user_data
+        await telegram_bot.handle_tracking_email(mock_update, mock_context, email)
         
-        # Verify loading message was deleted
-        loading_message.delete.assert_called_once()
-    
-    @pytest.mark.asyncio
-    async def test_handle_tracking_email_invalid(self, telegram_bot, mock_update, mock_context):
-        """Test handling invalid email for tracking"""
-        mock_context.user_data['tracking_state'] = 'waiting_for_email'
-        invalid_email = "invalid-email"
+        # Verify API usage
+        if expect_api_called:
+            assert telegram_bot.api_client.get_orders_by_email.await_count == 1
+            args, kwargs = telegram_bot.api_client.get_orders_by_email.await_args
+            assert (args, kwargs) == ((email,), {})
+        else:
+            telegram_bot.api_client.get_orders_by_email.assert_not_called()
         
-        await telegram_bot.handle_tracking_email(mock_update, mock_context, invalid_email)
+        # Verify the loading message is removed once orders were fetched
+        if expect_api_called and api_side_effect is None:
+            loading_message.delete.assert_called_once()
         
-        # Verify error message was sent
-        mock_update.message.reply_text.assert_called_once()
-        call_args = mock_update.message.reply_text.call_args
-        assert "Некорректный email" in call_args[0][0]
-        
-        # Verify API was not called
-        telegram_bot.api_client.get_orders_by_email.assert_not_called()
-        
-        # Verify tracking state was not cleared (user can try again)
-        assert mock_context.user_data['tracking_state'] == 'waiting_for_email'
-    
-    @pytest.mark.asyncio
-    async def test_handle_tracking_email_no_orders(self, telegram_bot, mock_update, mock_context):
-        """Test handling email with no orders found"""
-        mock_context.user_data['tracking_state'] = 'waiting_for_email'
-        test_email = "noorders@example.com"
-        
-        # Mock API response with empty list
-        telegram_bot.api_client.get_orders_by_email.return_value = []
-        
-        # Mock loading message
-        loading_message = AsyncMock()
-        loading_message.delete = AsyncMock()
-        mock_update.message.reply_text.return_value = loading_message
-        
-        await telegram_bot.handle_tracking_email(mock_update, mock_context, test_email)
-        
-        # Verify API was called
-        telegram_bot.api_client.get_orders_by_email.assert_called_once_with(test_email)
-        
-        # Verify "no orders found" message was sent
-        assert mock_update.message.reply_text.call_count == 2  # Loading + no orders message
-        call_args = mock_update.message.reply_text.call_args_list[1]
-        assert "Заказы не найдены" in call_args[0][0]
-        
-        # Verify tracking state was cleared
-        assert 'tracking_state' not in mock_context.user_data
-    
-    @pytest.mark.asyncio
-    async def test_handle_tracking_email_api_error(self, telegram_bot, mock_update, mock_context):
-        """Test handling API error during email tracking"""
-        mock_context.user_data['tracking_state'] = 'waiting_for_email'
-        test_email = "test@example.com"
+        # Verify the message shown to the user
+        if expect_text:
+            (message_text,), _ = mock_update.message.reply_text.await_args
+            assert expect_text in message_text
         
-        # Mock API error
-        telegram_bot.api_client.get_orders_by_email.side_effect = APIClientError("API Error", 500)
-        
-        # Mock loading message
-        loading_message = AsyncMock()
-        loading_message.delete = AsyncMock()
-        mock_update.message.reply_text.return_value = loading_message
-        
-        with patch('telegram_bot.main.BotErrorHandler.handle_api_error') as mock_error_handler:
-            mock_error_handler.return_value = AsyncMock()
-            
-            await telegram_bot.handle_tracking_email(mock_update, mock_context, test_email)
-            
-            # Verify error handler was called
+        # Verify API errors are routed to the error handler
+        if api_side_effect is not None:
             mock_error_handler.assert_called_once()
+        else:
+            mock_error_handler.assert_not_called()
         
-        # Verify tracking state was cleared
-        assert 'tracking_state' not in mock_context.user_data
+        # Verify tracking state (kept on invalid input so the user can retry)
+        if expect_state_cleared:
+            assert 'tracking_state' not in mock_context.user_data
+        else:
+            assert mock_context.user_data['tracking_state'] == 'waiting_for_email'
     
     @pytest.mark.asyncio
     async def test_show_orders_list(self, telegram_bot, mock_update, mock_context):
         """Test showing orders list"""
         test_email = "test@example.com"
-        mock_orders = [
-            {
-                'id': 1,
-                'status': 'new',
-                'service_name': 'FDM Printing',
-                'created_at': '2024-01-15T10:00:00Z',
-                'customer_name': 'Test User'
-            },
-            {
-                'id': 2,
-                'status': 'completed',
-                'service_name': 'SLA Printing',
-                'created_at': '2024-01-10T15:30:00Z',
-                'customer_name': 'Test User'
-            }
-        ]
         
-        await telegram_bot.show_orders_list(mock_update, mock_context, mock_orders, test_email)
+        await telegram_bot.show_orders_list(mock_update, mock_context, MOCK_ORDERS, test_email)
         
         # Verify message was sent
-        mock_update.message.reply_text.assert_called_once()
-        call_args = mock_update.message.reply_text.call_args
+        mock_update.message.reply_text.assert_awaited_once()
+        (message_text,), kwargs = mock_update.message.reply_text.await_args
         
         # Check message content
-        message_text = call_args[0][0]
-        assert "Ваши заказы (2)" in message_text
-        assert test_email in message_text
-        assert "Заказ #1" in message_text
-        assert "Заказ #2" in message_text
+        missing = [marker for marker in ORDERS_LIST_MARKERS if marker not in message_text]
+        assert not missing, f"missing markers: {missing}"
         
         # Check reply markup (keyboard)
-        reply_markup = call_args[1]['reply_markup']
+        reply_markup = kwargs['reply_markup']
         assert reply_markup is not None
         
-        # Verify keyboard has order detail buttons
+        # Verify keyboard has exactly one detail button per order
         keyboard = reply_markup.inline_keyboard
-        order_buttons = [btn for row in keyboard for btn in row if btn.callback_data.startswith('order_details_')]
-        assert len(order_buttons) == 2
+        order_buttons = frozenset(
+            btn.callback_data for row in keyboard for btn in row
+            if btn.callback_data.startswith('order_details_')
+        )
+        assert order_buttons == ORDER_DETAIL_CALLBACKS
     
     @pytest.mark.asyncio
     async def test_show_order_details(self, telegram_bot, mock_callback_update, mock_context):
@@ -248,82 +188,115 @@ class TestOrderTracking:
         
         # Verify message was sent/edited
         mock_callback_update.callback_query.edit_message_text.assert_called_once()
-        call_args = mock_callback_update.callback_query.edit_message_text.call_args
+        _, kwargs = mock_callback_update.callback_query.edit_message_text.await_args
         
         # Check message content
-        message_text = call_args[1]['text']
+        message_text = kwargs['text']
         assert f"Заказ #{order_id}" in message_text
     
     @pytest.mark.asyncio
     async def test_track_command(self, telegram_bot, mock_update, mock_context):
         """Test /track command"""
-        with patch.object(telegram_bot, 'start_order_tracking') as mock_start_tracking:
-            mock_start_tracking.return_value = AsyncMock()
-            
+        with patch.object(telegram_bot, 'start_order_tracking', new_callable=AsyncMock) as mock_start_tracking:
             await telegram_bot.track_command(mock_update, mock_context)
             
             # Verify start_order_tracking was called
-            mock_start_tracking.assert_called_once_with(mock_update, mock_context)
+            assert mock_start_tracking.await_count == 1
+            args, kwargs = mock_start_tracking.await_args
+            assert (args, kwargs) == ((mock_update, mock_context), {})
     
     def test_validate_email(self, telegram_bot):
         """Test email validation"""
-        # Valid emails
-        assert telegram_bot._validate_email("test@example.com") == True
-        assert telegram_bot._validate_email("user.name@domain.co.uk") == True
-        assert telegram_bot._validate_email("test+tag@example.org") == True
-        
-        # Invalid emails
-        assert telegram_bot._validate_email("") == False
-        assert telegram_bot._validate_email("invalid-email") == False
-        assert telegram_bot._validate_email("@example.com") == False
-        assert telegram_bot._validate_email("test@") == False
-        assert telegram_bot._validate_email("test.example.com") == False
+        results = [telegram_bot._validate_email(email) for email, _ in EMAIL_CASES]
+        assert results == [expected for _, expected in EMAIL_CASES]
+    
+    @pytest.mark.parametrize("raw,expected", ORDER_DATE_CASES)
+    def test_format_order_date(self, raw, expected):
+        """Test order date formatting for the orders list"""
+        assert _format_order_date(raw) == expected
     
     @pytest.mark.asyncio
     async def test_callback_query_tracking_handlers(self, telegram_bot, mock_callback_update, mock_context):
         """Test callback query handlers for tracking"""
-        # Test track_order callback
-        mock_callback_update.callback_query.data = "track_order"
-        
-        with patch.object(telegram_bot, 'start_order_tracking') as mock_start_tracking:
-            mock_start_tracking.return_value = AsyncMock()
+        with ExitStack() as stack:
+            mock_start_tracking = stack.enter_context(
+                patch.object(telegram_bot, 'start_order_tracking', new_callable=AsyncMock))
+            mock_main_menu = stack.enter_context(
+                patch.object(telegram_bot, 'show_main_menu', new_callable=AsyncMock))
+            mock_order_details = stack.enter_context(
+                patch.object(telegram_bot, 'show_order_details', new_callable=AsyncMock))
             
+            # Test track_order callback
+            mock_callback_update.callback_query.data = "track_order"
             await telegram_bot.handle_callback_query(mock_callback_update, mock_context)
-            
             mock_start_tracking.assert_called_once()
-        
-        # Test cancel_tracking callback
-        mock_callback_update.callback_query.data = "cancel_tracking"
-        mock_context.user_data['tracking_state'] = 'waiting_for_email'
-        
-        with patch.object(telegram_bot, 'show_main_menu') as mock_main_menu:
-            mock_main_menu.return_value = AsyncMock()
             
+            # Test cancel_tracking callback
+            mock_callback_update.callback_query.data = "cancel_tracking"
+            mock_context.user_data['tracking_state'] = 'waiting_for_email'
             await telegram_bot.handle_callback_query(mock_callback_update, mock_context)
             
             # Verify tracking state was cleared
             assert 'tracking_state' not in mock_context.user_data
             mock_main_menu.assert_called_once()
-        
-        # Test order_details callback
-        mock_callback_update.callback_query.data = "order_details_123"
-        
-        with patch.object(telegram_bot, 'show_order_details') as mock_order_details:
-            mock_order_details.return_value = AsyncMock()
             
+            # Test order_details callback
+            mock_callback_update.callback_query.data = "order_details_123"
             await telegram_bot.handle_callback_query(mock_callback_update, mock_context)
+            assert mock_order_details.await_count == 1
+            args, kwargs = mock_order_details.await_args
+            assert (args, kwargs) == ((mock_callback_update, mock_context, 123), {})
+    
+    @pytest.mark.asyncio
+    async def test_callback_query_handlers_are_concurrent_safe(self, telegram_bot, mock_context):
+        """Test that concurrently dispatched callbacks each reach their handler"""
+        updates = [make_callback_update(data=f"order_details_{i}") for i in range(50)]
+        
+        with patch.object(telegram_bot, 'show_order_details', new_callable=AsyncMock) as mock_order_details:
+            await asyncio.gather(*(telegram_bot.handle_callback_query(u, mock_context) for u in updates))
             
-            mock_order_details.assert_called_once_with(mock_callback_update, mock_context, 123)
+            assert mock_order_details.await_count == 50
+            order_ids = sorted(args[2] for args, _ in mock_order_details.await_args_list)
+            assert order_ids == list(range(50))
+    
+    @pytest.mark.asyncio
+    async def test_update_processor_serializes_per_chat(self):
+        """Test that a slow chat blocks its own updates but not other chats"""
+        processor = PerChatUpdateProcessor(8)
+        release_a = asyncio.Event()
+        handled = []
+        
+        async def handle(name, wait=None):
+            if wait is not None:
+                await wait.wait()
+            handled.append(name)
+        
+        def chat_update(chat_id):
+            return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+        
+        first_a = asyncio.create_task(processor.process_update(chat_update(1), handle("a1", release_a)))
+        second_a = asyncio.create_task(processor.process_update(chat_update(1), handle("a2")))
+        await asyncio.sleep(0)  # let chat 1 take its lock and start waiting
+        await processor.process_update(chat_update(2), handle("b1"))
+        
+        assert handled == ["b1"]
+        
+        release_a.set()
+        await asyncio.gather(first_a, second_a)
+        
+        assert handled == ["b1", "a1", "a2"]
+
+
+@pytest.fixture(scope="class")
+def api_client():
+    """Create API client shared by the class; no HTTP session is opened
+    because every test patches _make_request"""
+    return APIClient("http://test-api.com")
 
 
 class TestAPIClientOrderSearch:
     """Test cases for API client order search functionality"""
     
-    @pytest.fixture
-    def api_client(self):
-        """Create API client for testing"""
-        return APIClient("http://test-api.com")
-    
     @pytest.mark.asyncio
     async def test_get_orders_by_email_success(self, api_client):
         """Test successful order search by email"""
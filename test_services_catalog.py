@@ -1,56 +1,120 @@
 """
 Unit tests for services catalog functionality in Telegram bot.
 """
+import copy
+import re
 import pytest
+from types import MappingProxyType
 from unittest.mock import AsyncMock, MagicMock, patch
-from telegram import Update, User, Message, CallbackQuery, InlineKeyboardMarkup
+from telegram import InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from main import TelegramBot
-from api_client import APIClient, APIClientError
-from session_manager import SessionManager
+from conftest import make_callback_update, make_update
+from main import TelegramBot, _truncate
+from api_client import APIClientError
+from error_handler import BotErrorHandler
+
+
+# Read-only services catalog shared by every test
+SAMPLE_SERVICES = (
+    MappingProxyType({
+        "id": 1,
+        "name": "FDM 3D Печать",
+        "description": "Высококачественная FDM печать пластиком PLA, ABS, PETG",
+        "category": "3d_printing",
+        "features": ["Быстрая печать", "Различные материалы", "Высокое качество"],
+        "is_active": True
+    }),
+    MappingProxyType({
+        "id": 2,
+        "name": "SLA 3D Печать",
+        "description": "Точная печать фотополимерной смолой для детализированных моделей",
+        "category": "3d_printing",
+        "features": ["Высокая точность", "Гладкая поверхность", "Мелкие детали"],
+        "is_active": True
+    }),
+    MappingProxyType({
+        "id": 3,
+        "name": "Постобработка",
+        "description": "Шлифовка, покраска и финишная обработка 3D моделей",
+        "category": "post_processing",
+        "features": ["Профессиональная покраска", "Шлифовка", "Сборка"],
+        "is_active": True
+    })
+)
+
+# More services than fit on one catalog page (5 per page)
+MANY_SERVICES = tuple(
+    MappingProxyType({
+        "id": i + 1,
+        "name": f"Услуга {i + 1}",
+        "description": f"Описание услуги {i + 1}",
+        "category": "test",
+        "is_active": True
+    })
+    for i in range(12)
+)
+
+# Expected message content, in the order the handlers render it
+CATALOG_PAGE_RE = re.compile(r"📋 Каталог услуг NordLayer.*FDM 3D Печать.*SLA 3D Печать", re.DOTALL)
+EMPTY_CATALOG_RE = re.compile(r"услуги недоступны")
+SERVICE_DETAILS_RE = re.compile(r"FDM 3D Печать.*Высококачественная FDM печать.*Быстрая печать", re.DOTALL)
+
+# Telegram objects are immutable, so one markup instance serves every test
+EMPTY_MARKUP = InlineKeyboardMarkup([[]])
+
+
+@pytest.fixture(scope="class", autouse=True)
+def mock_settings():
+    """Patch bot settings once for the whole class"""
+    with patch('main.settings') as mock_settings:
+        mock_settings.telegram_bot_token = "test_token"
+        mock_settings.api_base_url = "http://test-api.com"
+        mock_settings.api_timeout = 30
+        mock_settings.log_level = "INFO"
+        mock_settings.log_file = "test.log"
+        yield mock_settings
+
+
+@pytest.fixture(scope="class")
+def _bot_prototype(mock_settings):
+    """Bot constructed once per class; tests work on shallow copies"""
+    return TelegramBot()
 
 
 class TestServicesCatalog:
     """Test cases for services catalog functionality"""
     
     @pytest.fixture
-    def bot(self):
+    def bot(self, _bot_prototype, mock_api_client, mock_session_manager):
         """Create bot instance for testing"""
-        with patch('main.settings') as mock_settings:
-            mock_settings.telegram_bot_token = "test_token"
-            mock_settings.api_base_url = "http://test-api.com"
-            mock_settings.api_timeout = 30
-            mock_settings.log_level = "INFO"
-            mock_settings.log_file = "test.log"
-            
-            bot = TelegramBot()
-            bot.api_client = AsyncMock(spec=APIClient)
-            bot.session_manager = MagicMock(spec=SessionManager)
-            return bot
+        bot = copy.copy(_bot_prototype)
+        bot.api_client = mock_api_client
+        bot.session_manager = mock_session_manager
+        return bot
     
     @pytest.fixture
     def mock_update(self):
         """Create mock update object"""
-        update = MagicMock(spec=Update)
-        update.effective_user = MagicMock(spec=User)
-        update.effective_user.id = 12345
-        update.effective_user.first_name = "TestUser"
-        update.message = MagicMock(spec=Message)
-        update.callback_query = None
-        return update
+        return make_update()
     
     @pytest.fixture
     def mock_callback_update(self):
         """Create mock callback query update"""
-        update = MagicMock(spec=Update)
-        update.effective_user = MagicMock(spec=User)
-        update.effective_user.id = 12345
-        update.effective_user.first_name = "TestUser"
-        update.callback_query = MagicMock(spec=CallbackQuery)
-        update.callback_query.message = MagicMock(spec=Message)
-        update.callback_query.edit_message_text = AsyncMock()
-        return update
+        return make_callback_update()
+    
+    @pytest.fixture
+    def bot_with_services(self, bot, sample_services):
+        """Bot whose API client returns the sample services catalog"""
+        bot.api_client.get_services.return_value = sample_services
+        return bot
+    
+    @pytest.fixture
+    def mock_error_handler(self, monkeypatch):
+        """Replace the API error handler with an AsyncMock"""
+        mock_error_handler = AsyncMock()
+        monkeypatch.setattr(BotErrorHandler, 'handle_api_error', mock_error_handler)
+        return mock_error_handler
     
     @pytest.fixture
     def mock_context(self):
@@ -60,41 +124,23 @@ class TestServicesCatalog:
     @pytest.fixture
     def sample_services(self):
         """Sample services data for testing"""
-        return [
-            {
-                "id": 1,
-                "name": "FDM 3D Печать",
-                "description": "Высококачественная FDM печать пластиком PLA, ABS, PETG",
-                "category": "3d_printing",
-                "features": ["Быстрая печать", "Различные материалы", "Высокое качество"],
-                "is_active": True
-            },
-            {
-                "id": 2,
-                "name": "SLA 3D Печать",
-                "description": "Точная печать фотополимерной смолой для детализированных моделей",
-                "category": "3d_printing",
-                "features": ["Высокая точность", "Гладкая поверхность", "Мелкие детали"],
-                "is_active": True
-            },
-            {
-                "id": 3,
-                "name": "Постобработка",
-                "description": "Шлифовка, покраска и финишная обработка 3D моделей",
-                "category": "post_processing",
-                "features": ["Профессиональная покраска", "Шлифовка", "Сборка"],
-                "is_active": True
-            }
-        ]
+        return SAMPLE_SERVICES
     
-    @pytest.mark.asyncio
-    async def test_services_command_success(self, bot, mock_update, mock_context, sample_services):
-        """Test successful services command execution"""
+    @pytest.mark.parametrize(
+        "api_return, api_side_effect, expected_pattern, expects_keyboard",
+        [
+            (SAMPLE_SERVICES, None, CATALOG_PAGE_RE, True),
+            ([], None, EMPTY_CATALOG_RE, False),
+            (None, APIClientError("API Error", 500), None, False),
+        ],
+        ids=["success", "empty", "api_error"]
+    )
+    async def test_services_command(self, bot, mock_update, mock_context, mock_error_handler, api_return,
+                                    api_side_effect, expected_pattern, expects_keyboard):
+        """Test services command execution"""
         # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
-        # Mock message reply
-        mock_update.message.reply_text = AsyncMock()
+        bot.api_client.get_services.return_value = api_return
+        bot.api_client.get_services.side_effect = api_side_effect
         
         # Execute command
         await bot.services_command(mock_update, mock_context)
@@ -102,70 +148,29 @@ class TestServicesCatalog:
         # Verify API was called
         bot.api_client.get_services.assert_called_once_with(active_only=True)
         
+        # Verify API errors are routed to the error handler
+        if expected_pattern is None:
+            mock_error_handler.assert_called_once()
+            mock_update.message.reply_text.assert_not_called()
+            return
+        mock_error_handler.assert_not_called()
+        
         # Verify message was sent
         mock_update.message.reply_text.assert_called_once()
         call_args = mock_update.message.reply_text.call_args
         
         # Check message content
         message_text = call_args[1]['text']
-        assert "📋 Каталог услуг NordLayer" in message_text
-        assert "FDM 3D Печать" in message_text
-        assert "SLA 3D Печать" in message_text
+        assert expected_pattern.search(message_text), message_text
         
         # Check keyboard
         reply_markup = call_args[1]['reply_markup']
-        assert isinstance(reply_markup, InlineKeyboardMarkup)
-    
-    @pytest.mark.asyncio
-    async def test_services_command_empty_response(self, bot, mock_update, mock_context):
-        """Test services command with empty services list"""
-        # Mock empty API response
-        bot.api_client.get_services.return_value = []
-        
-        # Mock message reply
-        mock_update.message.reply_text = AsyncMock()
-        
-        # Execute command
-        await bot.services_command(mock_update, mock_context)
-        
-        # Verify message was sent with appropriate content
-        mock_update.message.reply_text.assert_called_once()
-        call_args = mock_update.message.reply_text.call_args
-        message_text = call_args[1]['text']
-        assert "услуги недоступны" in message_text
+        assert isinstance(reply_markup, InlineKeyboardMarkup) == expects_keyboard
     
-    @pytest.mark.asyncio
-    async def test_services_command_api_error(self, bot, mock_update, mock_context):
-        """Test services command with API error"""
-        # Mock API error
-        bot.api_client.get_services.side_effect = APIClientError("API Error", 500)
-        
-        # Mock error handler
-        with patch('main.BotErrorHandler.handle_api_error') as mock_error_handler:
-            mock_error_handler.return_value = AsyncMock()
-            
-            # Execute command
-            await bot.services_command(mock_update, mock_context)
-            
-            # Verify error handler was called
-            mock_error_handler.assert_called_once()
-    
-    @pytest.mark.asyncio
     async def test_show_services_catalog_pagination(self, bot, mock_update, mock_context):
         """Test services catalog with pagination"""
-        # Create more services than fit on one page
-        many_services = []
-        for i in range(12):  # More than 5 services per page
-            many_services.append({
-                "id": i + 1,
-                "name": f"Услуга {i + 1}",
-                "description": f"Описание услуги {i + 1}",
-                "category": "test",
-                "is_active": True
-            })
-        
-        bot.api_client.get_services.return_value = many_services
-        mock_update.message.reply_text = AsyncMock()
+        # More services than fit on one page
+        bot.api_client.get_services.return_value = MANY_SERVICES
         
         # Test first page
         await bot.show_services_catalog(mock_update, mock_context, page=0)
@@ -187,23 +192,17 @@ class TestServicesCatalog:
         pagination_buttons = [btn for row in keyboard for btn in row if "Вперёд" in btn.text or "Назад" in btn.text]
         assert len(pagination_buttons) > 0
     
-    @pytest.mark.asyncio
-    async def test_handle_service_selection_success(self, bot, mock_callback_update, mock_context, sample_services):
+    async def test_handle_service_selection_success(self, bot_with_services, mock_callback_update, mock_context):
         """Test successful service selection"""
-        # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
         # Execute service selection
-        await bot.handle_service_selection(mock_callback_update, mock_context, service_id=1)
+        await bot_with_services.handle_service_selection(mock_callback_update, mock_context, service_id=1)
         
         # Verify message was edited with service details
         mock_callback_update.callback_query.edit_message_text.assert_called_once()
         call_args = mock_callback_update.callback_query.edit_message_text.call_args
         
         message_text = call_args[1]['text']
-        assert "FDM 3D Печать" in message_text
-        assert "Высококачественная FDM печать" in message_text
-        assert "Быстрая печать" in message_text
+        assert SERVICE_DETAILS_RE.search(message_text), message_text
         
         # Check keyboard has order button
         reply_markup = call_args[1]['reply_markup']
@@ -212,17 +211,10 @@ class TestServicesCatalog:
         assert len(order_buttons) == 1
         assert "order_service_1" in order_buttons[0].callback_data
     
-    @pytest.mark.asyncio
-    async def test_handle_service_selection_not_found(self, bot, mock_callback_update, mock_context, sample_services):
+    async def test_handle_service_selection_not_found(self, bot_with_services, mock_callback_update, mock_context):
         """Test service selection with non-existent service ID"""
-        # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
-        # Mock reply_text for error message
-        mock_callback_update.callback_query.message.reply_text = AsyncMock()
-        
         # Execute service selection with non-existent ID
-        await bot.handle_service_selection(mock_callback_update, mock_context, service_id=999)
+        await bot_with_services.handle_service_selection(mock_callback_update, mock_context, service_id=999)
         
         # Verify error message was sent
         mock_callback_update.callback_query.message.reply_text.assert_called_once()
@@ -230,159 +222,106 @@ class TestServicesCatalog:
         message_text = call_args[0][0]
         assert "Услуга не найдена" in message_text
     
-    @pytest.mark.asyncio
-    async def test_callback_query_services_page(self, bot, mock_callback_update, mock_context, sample_services):
-        """Test callback query for services pagination"""
-        # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
-        # Mock callback query data
-        mock_callback_update.callback_query.data = "services_page_1"
-        mock_callback_update.callback_query.answer = AsyncMock()
-        
-        # Execute callback handler
-        await bot.handle_callback_query(mock_callback_update, mock_context)
-        
-        # Verify callback was answered
-        mock_callback_update.callback_query.answer.assert_called_once()
-        
-        # Verify API was called
-        bot.api_client.get_services.assert_called_with(active_only=True)
-    
-    @pytest.mark.asyncio
-    async def test_callback_query_select_service(self, bot, mock_callback_update, mock_context, sample_services):
-        """Test callback query for service selection"""
-        # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
-        # Mock callback query data
-        mock_callback_update.callback_query.data = "select_service_2"
-        mock_callback_update.callback_query.answer = AsyncMock()
-        
-        # Execute callback handler
-        await bot.handle_callback_query(mock_callback_update, mock_context)
-        
-        # Verify callback was answered
-        mock_callback_update.callback_query.answer.assert_called_once()
-        
-        # Verify service details were shown
-        mock_callback_update.callback_query.edit_message_text.assert_called_once()
-        call_args = mock_callback_update.callback_query.edit_message_text.call_args
-        message_text = call_args[1]['text']
-        assert "SLA 3D Печать" in message_text
-    
-    @pytest.mark.asyncio
-    async def test_callback_query_show_services(self, bot, mock_callback_update, mock_context, sample_services):
-        """Test callback query for showing services catalog"""
-        # Mock API response
-        bot.api_client.get_services.return_value = sample_services
-        
+    @pytest.mark.parametrize(
+        "callback_data, expected_text, expects_api_call",
+        [
+            ("services_page_1", "📋 Каталог услуг", True),
+            ("select_service_2", "SLA 3D Печать", True),
+            ("show_services", "📋 Каталог услуг NordLayer", True),
+            ("main_menu", "Добро пожаловать в NordLayer", False),
+        ],
+        ids=["services_page", "select_service", "show_services", "main_menu"]
+    )
+    async def test_callback_query(self, bot_with_services, mock_callback_update, mock_context,
+                                  callback_data, expected_text, expects_api_call):
+        """Test callback query routing for catalog navigation"""
         # Mock callback query data
-        mock_callback_update.callback_query.data = "show_services"
-        mock_callback_update.callback_query.answer = AsyncMock()
+        mock_callback_update.callback_query.data = callback_data
         
         # Execute callback handler
-        await bot.handle_callback_query(mock_callback_update, mock_context)
+        await bot_with_services.handle_callback_query(mock_callback_update, mock_context)
         
         # Verify callback was answered
         mock_callback_update.callback_query.answer.assert_called_once()
         
-        # Verify services catalog was shown
-        mock_callback_update.callback_query.edit_message_text.assert_called_once()
-        call_args = mock_callback_update.callback_query.edit_message_text.call_args
-        message_text = call_args[1]['text']
-        assert "📋 Каталог услуг NordLayer" in message_text
-    
-    @pytest.mark.asyncio
-    async def test_callback_query_main_menu(self, bot, mock_callback_update, mock_context):
-        """Test callback query for main menu"""
-        # Mock callback query data
-        mock_callback_update.callback_query.data = "main_menu"
-        mock_callback_update.callback_query.answer = AsyncMock()
-        
-        # Execute callback handler
-        await bot.handle_callback_query(mock_callback_update, mock_context)
+        # Verify API usage
+        if expects_api_call:
+            bot_with_services.api_client.get_services.assert_called_with(active_only=True)
+        else:
+            bot_with_services.api_client.get_services.assert_not_called()
         
-        # Verify callback was answered
-        mock_callback_update.callback_query.answer.assert_called_once()
-        
-        # Verify main menu was shown
+        # Verify the expected screen was shown
         mock_callback_update.callback_query.edit_message_text.assert_called_once()
         call_args = mock_callback_update.callback_query.edit_message_text.call_args
         message_text = call_args[1]['text']
-        assert "Добро пожаловать в NordLayer" in message_text
+        assert expected_text in message_text
     
-    @pytest.mark.asyncio
     async def test_send_or_edit_message_callback(self, bot, mock_callback_update):
         """Test _send_or_edit_message with callback query"""
         test_text = "Test message"
-        test_markup = InlineKeyboardMarkup([[]])
         
-        await bot._send_or_edit_message(mock_callback_update, test_text, test_markup)
+        await bot._send_or_edit_message(mock_callback_update, test_text, EMPTY_MARKUP)
         
         # Verify edit_message_text was called
-        mock_callback_update.callback_query.edit_message_text.assert_called_once_with(
-            text=test_text,
-            reply_markup=test_markup,
-            parse_mode='Markdown'
-        )
+        assert mock_callback_update.callback_query.edit_message_text.await_count == 1
+        args, kwargs = mock_callback_update.callback_query.edit_message_text.await_args
+        assert (args, kwargs) == ((), {"text": test_text, "reply_markup": EMPTY_MARKUP, "parse_mode": 'Markdown'})
+        assert kwargs['reply_markup'] is EMPTY_MARKUP
     
-    @pytest.mark.asyncio
     async def test_send_or_edit_message_regular(self, bot, mock_update):
         """Test _send_or_edit_message with regular message"""
         test_text = "Test message"
-        test_markup = InlineKeyboardMarkup([[]])
-        mock_update.message.reply_text = AsyncMock()
         
-        await bot._send_or_edit_message(mock_update, test_text, test_markup)
+        await bot._send_or_edit_message(mock_update, test_text, EMPTY_MARKUP)
         
         # Verify reply_text was called
-        mock_update.message.reply_text.assert_called_once_with(
-            text=test_text,
-            reply_markup=test_markup,
-            parse_mode='Markdown'
-        )
+        assert mock_update.message.reply_text.await_count == 1
+        args, kwargs = mock_update.message.reply_text.await_args
+        assert (args, kwargs) == ((), {"text": test_text, "reply_markup": EMPTY_MARKUP, "parse_mode": 'Markdown'})
+        assert kwargs['reply_markup'] is EMPTY_MARKUP
     
-    def test_service_data_formatting(self, sample_services):
-        """Test service data formatting logic"""
-        service = sample_services[0]
-        
-        # Test name extraction
-        assert service.get('name') == "FDM 3D Печать"
-        
-        # Test description truncation logic
-        long_description = "A" * 100
-        truncated = long_description[:77] + "..." if len(long_description) > 80 else long_description
-        assert len(truncated) <= 80
-        
-        # Test features formatting
-        features = service.get('features', [])
-        assert isinstance(features, list)
-        assert len(features) > 0
+    @pytest.mark.parametrize(
+        "text, limit, expected",
+        [
+            ("short", 80, "short"),
+            ("A" * 80, 80, "A" * 80),
+            ("A" * 100, 80, "A" * 77 + "..."),
+            ("A" * 35, 30, "A" * 27 + "..."),
+        ],
+        ids=["short", "at_limit", "description", "button"]
+    )
+    def test_truncate(self, text, limit, expected):
+        """Test preview and button text truncation"""
+        assert _truncate(text, limit) == expected
     
-    def test_pagination_logic(self):
-        """Test pagination calculation logic"""
-        services_per_page = 5
-        
-        # Test with 12 services
-        total_services = 12
-        total_pages = (total_services + services_per_page - 1) // services_per_page
-        assert total_pages == 3
-        
-        # Test page 0
-        page = 0
-        start_idx = page * services_per_page
-        end_idx = min(start_idx + services_per_page, total_services)
-        assert start_idx == 0
-        assert end_idx == 5
-        
-        # Test page 2 (last page)
-        page = 2
-        start_idx = page * services_per_page
-        end_idx = min(start_idx + services_per_page, total_services)
-        assert start_idx == 10
-        assert end_idx == 12
-
+    @pytest.mark.parametrize(
+        "page, expected_ids, expected_navigation",
+        [
+            (0, range(1, 6), ("services_page_1",)),
+            (1, range(6, 11), ("services_page_0", "services_page_2")),
+            (2, range(11, 13), ("services_page_1",)),
+        ],
+        ids=["first_page", "middle_page", "last_page"]
+    )
+    async def test_pagination_logic(self, bot, mock_update, mock_context, page, expected_ids, expected_navigation):
+        """Test each catalog page lists its own services and links to its neighbours"""
+        bot.api_client.get_services.return_value = MANY_SERVICES
+        
+        await bot.show_services_catalog(mock_update, mock_context, page=page)
+        
+        _, kwargs = mock_update.message.reply_text.call_args
+        message_text = kwargs['text']
+        keyboard = kwargs['reply_markup'].inline_keyboard
+        
+        assert f"Страница {page + 1} из 3" in message_text
+        for service_id in expected_ids:
+            assert f"{service_id}. **Услуга {service_id}**" in message_text
+        
+        service_buttons = [row[0].callback_data for row in keyboard[:-2]]
+        assert service_buttons == [f"select_service_{service_id}" for service_id in expected_ids]
+        # Navigation row sits just above the main menu button
+        assert tuple(button.callback_data for button in keyboard[-2]) == expected_navigation
+        assert keyboard[-1][0].callback_data == "main_menu"
 
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
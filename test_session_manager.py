@@ -2,10 +2,80 @@
 Unit tests for the session manager and OrderSession.
 """
 import pytest
-from datetime import datetime, timedelta
+from datetime import datetime
+from types import MappingProxyType
 from session_manager import SessionManager, OrderSession, OrderStep
 
 
+# Fields of a session that is ready to be submitted as an order
+COMPLETE_SESSION_FIELDS = MappingProxyType({
+    "customer_name": "Complete User",
+    "customer_email": "complete@example.com",
+    "service_id": 1,
+    "files": ({"filename": "complete.stl"},)
+})
+
+# Order data expected from the session built in test_to_order_data_basic
+_EXPECTED_BASIC_ORDER = MappingProxyType({
+    "customer_name": "John Doe",
+    "customer_email": "john@example.com",
+    "customer_phone": "+1234567890",
+    "service_id": 1,
+    "source": "TELEGRAM",
+    "specifications": MappingProxyType({
+        "material": "PLA",
+        "quality": "high",
+        "files_info": [MappingProxyType({"filename": "test.stl", "file_id": "abc123"})],
+        "order_source": "telegram_bot",
+        "bot_user_id": 123,
+        "customer_phone": "+1234567890"
+    }),
+    "customer_contact": "john@example.com"
+})
+
+
+# Lines expected in the get_summary output of the matching tests
+_SUMMARY_BASIC_NEEDLES = (
+    "📋 Резюме заказа:",
+    "Summary User",
+    "summary@example.com",
+    "+1234567890",
+    "FDM Printing",
+    "Файлов: 2",
+)
+_SUMMARY_SPECIFICATIONS_NEEDLES = (
+    "⚙️ Параметры:",
+    "material: PLA",
+    "quality: high",
+    "infill: 20%",
+)
+_SUMMARY_DELIVERY_NEEDLES = (
+    "🚚 Доставка: Требуется",
+    "📍 Адрес: 456 Oak Ave, Town",
+)
+
+
+class _FrozenDatetime(datetime):
+    """datetime whose now() is pinned to 2024-01-15 12:00"""
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 15, 12, 0, 0, tzinfo=tz)
+
+
+def _make_session(**fields):
+    """Build an OrderSession for user 123 with its own files list"""
+    if "files" in fields:
+        fields["files"] = list(fields["files"])
+    return OrderSession(user_id=123, **fields)
+
+
+def _seed(session_manager, user_ids, created_at=datetime(2024, 1, 1)):
+    """Insert sessions directly, skipping create_session and its clock read"""
+    for user_id in user_ids:
+        session_manager.sessions[user_id] = OrderSession(user_id=user_id, created_at=created_at)
+
+
 class TestOrderSession:
     """Test cases for OrderSession dataclass"""
     
@@ -52,109 +122,52 @@ class TestOrderSession:
         
         order_data = session.to_order_data()
         
-        expected = {
-            "customer_name": "John Doe",
-            "customer_email": "john@example.com",
-            "customer_phone": "+1234567890",
-            "service_id": 1,
-            "source": "TELEGRAM",
-            "specifications": {
-                "material": "PLA",
-                "quality": "high",
-                "files_info": [{"filename": "test.stl", "file_id": "abc123"}]
-            }
-        }
-        
-        assert order_data == expected
-    
-    def test_to_order_data_with_delivery(self):
-        """Test conversion to order data with delivery information"""
-        session = OrderSession(
-            user_id=123,
+        assert order_data == _EXPECTED_BASIC_ORDER
+    
+    @pytest.mark.parametrize(
+        "delivery_needed, delivery_details, expected_flag",
+        [
+            (True, "123 Main St, City", "true"),
+            (False, None, "false"),
+        ],
+        ids=["with_delivery", "no_delivery"]
+    )
+    def test_to_order_data_delivery(self, delivery_needed, delivery_details, expected_flag):
+        """Test conversion to order data with and without delivery"""
+        session = _make_session(
             customer_name="Jane Doe",
             customer_email="jane@example.com",
             service_id=2,
-            delivery_needed=True,
-            delivery_details="123 Main St, City"
-        )
-        session.files = [{"filename": "model.obj"}]
-        
-        order_data = session.to_order_data()
-        
-        assert order_data["delivery_needed"] == "true"
-        assert order_data["delivery_details"] == "123 Main St, City"
-    
-    def test_to_order_data_no_delivery(self):
-        """Test conversion to order data without delivery"""
-        session = OrderSession(
-            user_id=123,
-            customer_name="Bob Smith",
-            customer_email="bob@example.com",
-            service_id=3,
-            delivery_needed=False
+            delivery_needed=delivery_needed,
+            delivery_details=delivery_details,
+            files=[{"filename": "model.obj"}]
         )
-        session.files = [{"filename": "part.3mf"}]
         
         order_data = session.to_order_data()
         
-        assert order_data["delivery_needed"] == "false"
-        assert "delivery_details" not in order_data
-    
-    def test_is_complete_true(self):
-        """Test is_complete returns True for complete session"""
-        session = OrderSession(
-            user_id=123,
-            customer_name="Complete User",
-            customer_email="complete@example.com",
-            service_id=1
-        )
-        session.files = [{"filename": "complete.stl"}]
-        
-        assert session.is_complete() is True
-    
-    def test_is_complete_false_missing_name(self):
-        """Test is_complete returns False when name is missing"""
-        session = OrderSession(
-            user_id=123,
-            customer_email="incomplete@example.com",
-            service_id=1
-        )
-        session.files = [{"filename": "file.stl"}]
-        
-        assert session.is_complete() is False
-    
-    def test_is_complete_false_missing_email(self):
-        """Test is_complete returns False when email is missing"""
-        session = OrderSession(
-            user_id=123,
-            customer_name="Incomplete User",
-            service_id=1
-        )
-        session.files = [{"filename": "file.stl"}]
-        
-        assert session.is_complete() is False
-    
-    def test_is_complete_false_missing_service(self):
-        """Test is_complete returns False when service is missing"""
-        session = OrderSession(
-            user_id=123,
-            customer_name="Incomplete User",
-            customer_email="incomplete@example.com"
-        )
-        session.files = [{"filename": "file.stl"}]
-        
-        assert session.is_complete() is False
-    
-    def test_is_complete_false_no_files(self):
-        """Test is_complete returns False when no files"""
-        session = OrderSession(
-            user_id=123,
-            customer_name="Incomplete User",
-            customer_email="incomplete@example.com",
-            service_id=1
-        )
-        
-        assert session.is_complete() is False
+        assert order_data["delivery_needed"] == expected_flag
+        if delivery_details:
+            assert order_data["delivery_details"] == delivery_details
+        else:
+            assert "delivery_details" not in order_data
+    
+    @pytest.mark.parametrize(
+        "missing, expected",
+        [
+            (None, True),
+            ("customer_name", False),
+            ("customer_email", False),
+            ("service_id", False),
+            ("files", False),
+        ],
+        ids=["complete", "missing_name", "missing_email", "missing_service", "no_files"]
+    )
+    def test_is_complete(self, missing, expected):
+        """Test is_complete requires name, email, service and at least one file"""
+        fields = {key: value for key, value in COMPLETE_SESSION_FIELDS.items() if key != missing}
+        session = _make_session(**fields)
+        
+        assert session.is_complete() is expected
     
     def test_get_summary_basic(self):
         """Test get_summary with basic information"""
@@ -169,12 +182,8 @@ class TestOrderSession:
         
         summary = session.get_summary()
         
-        assert "📋 Резюме заказа:" in summary
-        assert "Summary User" in summary
-        assert "summary@example.com" in summary
-        assert "+1234567890" in summary
-        assert "FDM Printing" in summary
-        assert "Файлов: 2" in summary
+        missing = [needle for needle in _SUMMARY_BASIC_NEEDLES if needle not in summary]
+        assert not missing, missing
     
     def test_get_summary_with_specifications(self):
         """Test get_summary with specifications"""
@@ -187,10 +196,8 @@ class TestOrderSession:
         
         summary = session.get_summary()
         
-        assert "⚙️ Параметры:" in summary
-        assert "material: PLA" in summary
-        assert "quality: high" in summary
-        assert "infill: 20%" in summary
+        missing = [needle for needle in _SUMMARY_SPECIFICATIONS_NEEDLES if needle not in summary]
+        assert not missing, missing
     
     def test_get_summary_with_delivery(self):
         """Test get_summary with delivery information"""
@@ -202,8 +209,8 @@ class TestOrderSession:
         
         summary = session.get_summary()
         
-        assert "🚚 Доставка: Требуется" in summary
-        assert "📍 Адрес: 456 Oak Ave, Town" in summary
+        missing = [needle for needle in _SUMMARY_DELIVERY_NEEDLES if needle not in summary]
+        assert not missing, missing
     
     def test_get_summary_no_delivery(self):
         """Test get_summary without delivery"""
@@ -221,21 +228,22 @@ class TestSessionManager:
     """Test cases for SessionManager"""
     
     @pytest.fixture
-    def session_manager(self):
-        """Create SessionManager instance for testing"""
-        return SessionManager()
+    def prepared_session(self, session_manager):
+        """Session manager holding one fresh session, with that session's user id"""
+        user_id = 161718
+        session_manager.create_session(user_id)
+        return session_manager, user_id
     
-    def test_session_manager_creation(self, session_manager):
+    def test_session_manager_creation(self):
         """Test SessionManager initialization"""
-        assert isinstance(session_manager.sessions, dict)
-        assert len(session_manager.sessions) == 0
+        session_manager = SessionManager()
+        assert session_manager.sessions == {}
     
     def test_create_session(self, session_manager):
         """Test creating a new session"""
         user_id = 123
         session = session_manager.create_session(user_id)
         
-        assert isinstance(session, OrderSession)
         assert session.user_id == user_id
         assert session.step == OrderStep.START
         assert user_id in session_manager.sessions
@@ -269,14 +277,12 @@ class TestSessionManager:
         user_id = 101112
         session = session_manager.get_or_create_session(user_id)
         
-        assert isinstance(session, OrderSession)
         assert session.user_id == user_id
         assert user_id in session_manager.sessions
     
-    def test_update_session_existing(self, session_manager):
+    def test_update_session_existing(self, prepared_session):
         """Test updating an existing session"""
-        user_id = 131415
-        session_manager.create_session(user_id)
+        session_manager, user_id = prepared_session
         
         updated_session = session_manager.update_session(
             user_id,
@@ -295,10 +301,9 @@ class TestSessionManager:
         result = session_manager.update_session(999, customer_name="Test")
         assert result is None
     
-    def test_update_session_invalid_field(self, session_manager):
+    def test_update_session_invalid_field(self, prepared_session):
         """Test updating session with invalid field"""
-        user_id = 161718
-        session_manager.create_session(user_id)
+        session_manager, user_id = prepared_session
         
         # This should not raise an error, but should log a warning
         updated_session = session_manager.update_session(
@@ -311,6 +316,17 @@ class TestSessionManager:
         assert updated_session.customer_name == "Valid Name"
         assert not hasattr(updated_session, 'invalid_field')
     
+    @pytest.mark.parametrize("key", ["is_complete", "to_order_data", "__class__"])
+    def test_update_session_ignores_non_field_attributes(self, prepared_session, key):
+        """Test that methods and other non-field attributes are not overwritten"""
+        session_manager, user_id = prepared_session
+        original = getattr(session_manager.get_session(user_id), key)
+        
+        updated_session = session_manager.update_session(user_id, **{key: "should be ignored"})
+        
+        assert getattr(updated_session, key) == original
+        assert key not in vars(updated_session)
+    
     def test_clear_session_existing(self, session_manager):
         """Test clearing an existing session"""
         user_id = 192021
@@ -328,6 +344,14 @@ class TestSessionManager:
         result = session_manager.clear_session(999)
         assert result is False
     
+    def test_clear(self, session_manager):
+        """Test clearing all sessions"""
+        _seed(session_manager, (1, 2))
+        
+        session_manager.clear()
+        
+        assert session_manager.get_active_sessions_count() == 0
+    
     def test_reset_session_step(self, session_manager):
         """Test resetting session step"""
         user_id = 222324
@@ -348,9 +372,7 @@ class TestSessionManager:
         """Test getting active sessions count"""
         assert session_manager.get_active_sessions_count() == 0
         
-        session_manager.create_session(1)
-        session_manager.create_session(2)
-        session_manager.create_session(3)
+        _seed(session_manager, (1, 2, 3))
         
         assert session_manager.get_active_sessions_count() == 3
         
@@ -358,19 +380,13 @@ class TestSessionManager:
         
         assert session_manager.get_active_sessions_count() == 2
     
-    def test_cleanup_old_sessions(self, session_manager):
+    def test_cleanup_old_sessions(self, session_manager, monkeypatch):
         """Test cleaning up old sessions"""
-        # Create sessions with different ages
-        old_time = datetime.now() - timedelta(hours=25)
-        recent_time = datetime.now() - timedelta(hours=1)
-        
-        # Create old session
-        old_session = session_manager.create_session(1)
-        old_session.created_at = old_time
+        monkeypatch.setattr("session_manager.datetime", _FrozenDatetime)
         
-        # Create recent session
-        recent_session = session_manager.create_session(2)
-        recent_session.created_at = recent_time
+        # Old session 25 hours and recent session 1 hour before the frozen now
+        _seed(session_manager, (1,), created_at=datetime(2024, 1, 14, 11, 0, 0))
+        _seed(session_manager, (2,), created_at=datetime(2024, 1, 15, 11, 0, 0))
         
         assert session_manager.get_active_sessions_count() == 2
         
@@ -3,29 +3,139 @@ Tests for the webhook handler.
 """
 import pytest
 import asyncio
+import hashlib
+import hmac
 import json
-from unittest.mock import AsyncMock, MagicMock, patch
-from aiohttp import web
-from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+from types import MappingProxyType, SimpleNamespace
 
-from webhook_handler import WebhookHandler
-from notification_service import NotificationService
+from config import settings
 
 
-class TestWebhookHandler(AioHTTPTestCase):
+# Webhook payloads, serialized once at import
+NEW_ORDER_PAYLOAD = {
+    "type": "new_order",
+    "data": {
+        "id": 123,
+        "customer_name": "Test Customer",
+        "customer_email": "test@example.com",
+        "service_name": "FDM Printing",
+        "source": "TELEGRAM",
+        "specifications": {
+            "telegram_user_id": 456789
+        }
+    },
+    "timestamp": "2024-01-01T12:00:00Z"
+}
+NEW_ORDER_BODY = json.dumps(NEW_ORDER_PAYLOAD).encode()
+
+STATUS_CHANGE_PAYLOAD = {
+    "type": "status_change",
+    "data": {
+        "id": 123,
+        "customer_name": "Test Customer",
+        "customer_email": "test@example.com",
+        "service_name": "FDM Printing",
+        "status": "ready",
+        "source": "TELEGRAM"
+    },
+    "timestamp": "2024-01-01T12:00:00Z"
+}
+STATUS_CHANGE_BODY = json.dumps(STATUS_CHANGE_PAYLOAD).encode()
+
+TEST_NOTIFICATION_PAYLOAD = {
+    "type": "test",
+    "data": {
+        "message": "Test notification"
+    },
+    "timestamp": "2024-01-01T12:00:00Z"
+}
+TEST_NOTIFICATION_BODY = json.dumps(TEST_NOTIFICATION_PAYLOAD).encode()
+
+UNKNOWN_TYPE_PAYLOAD = {
+    "type": "unknown_type",
+    "data": {},
+    "timestamp": "2024-01-01T12:00:00Z"
+}
+UNKNOWN_TYPE_BODY = json.dumps(UNKNOWN_TYPE_PAYLOAD).encode()
+
+SERVICE_ERROR_ORDER_PAYLOAD = {
+    "type": "new_order",
+    "data": {
+        "id": 123,
+        "customer_name": "Test Customer",
+        "source": "TELEGRAM"
+    },
+    "timestamp": "2024-01-01T12:00:00Z"
+}
+SERVICE_ERROR_ORDER_BODY = json.dumps(SERVICE_ERROR_ORDER_PAYLOAD).encode()
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Response bodies, without the per-request processed_at stamp
+NEW_ORDER_RESPONSE = MappingProxyType({"success": True, "message": "Notification new_order processed"})
+STATUS_CHANGE_RESPONSE = MappingProxyType({"success": True, "message": "Notification status_change processed"})
+TEST_NOTIFICATION_RESPONSE = MappingProxyType({"success": True, "message": "Notification test processed"})
+UNKNOWN_TYPE_RESPONSE = MappingProxyType({"error": "Unknown notification type: unknown_type"})
+INVALID_JSON_RESPONSE = MappingProxyType({"error": "Invalid JSON"})
+PAYLOAD_TOO_LARGE_RESPONSE = MappingProxyType({"error": "Payload too large"})
+TOO_MANY_REQUESTS_RESPONSE = MappingProxyType({"error": "Too many requests"})
+INTERNAL_ERROR_RESPONSE = MappingProxyType({"error": "Failed to process notification"})
+DUPLICATE_NEW_ORDER_RESPONSE = MappingProxyType({"success": True, "message": "Notification new_order already processed"})
+IN_PROGRESS_NEW_ORDER_RESPONSE = MappingProxyType({"error": "Notification new_order is being processed"})
+
+# Notification data passed straight to the handler methods, which only read it
+WEB_ORDER = MappingProxyType({
+    "id": 123,
+    "customer_name": "Test Customer",
+    "source": "WEB"
+})
+TELEGRAM_ORDER = MappingProxyType({
+    "id": 123,
+    "customer_name": "Test Customer",
+    "source": "TELEGRAM",
+    "specifications": {
+        "telegram_user_id": 456789
+    }
+})
+TELEGRAM_STATUS_CHANGE = MappingProxyType({
+    "id": 123,
+    "customer_email": "test@example.com",
+    "source": "TELEGRAM",
+    "status": "ready"
+})
+WEB_STATUS_CHANGE = MappingProxyType({**TELEGRAM_STATUS_CHANGE, "source": "WEB"})
+TEST_MESSAGE = MappingProxyType({"message": "Test"})
+
+
+async def _call_handler(handler, body, headers=None):
+    """Run handle_notification on a stand-in request carrying body, skipping HTTP"""
+    async def read():
+        return body
+    
+    return await handler.handle_notification(SimpleNamespace(read=read, headers=headers or {}))
+
+
+@pytest.fixture(scope="class")
+async def client(_webhook_handler):
+    """Test client for the shared webhook application, served for the whole class"""
+    # Imported here so collecting the unit tests skips aiohttp's test server
+    from aiohttp.test_utils import TestClient, TestServer
+    
+    async with TestClient(TestServer(_webhook_handler.app)) as client:
+        yield client
+
+
+class TestWebhookHandler:
     """Tests for WebhookHandler"""
     
-    async def get_application(self):
-        """Create test application"""
-        # Mock notification service
-        self.mock_notification_service = AsyncMock(spec=NotificationService)
-        self.webhook_handler = WebhookHandler(self.mock_notification_service)
-        return self.webhook_handler.app
+    @pytest.fixture
+    def notification_service(self, webhook_handler):
+        """Notification service stub behind the served application"""
+        return webhook_handler.notification_service
     
-    @unittest_run_loop
-    async def test_health_check(self):
+    async def test_health_check(self, client):
         """Test health check endpoint"""
-        resp = await self.client.request("GET", "/webhook/health")
+        resp = await client.request("GET", "/webhook/health")
         
         assert resp.status == 200
         data = await resp.json()
@@ -33,257 +143,232 @@ class TestWebhookHandler(AioHTTPTestCase):
         assert data["service"] == "telegram_webhook_handler"
         assert "timestamp" in data
     
-    @unittest_run_loop
-    async def test_handle_new_order_notification(self):
-        """Test handling new order notification"""
-        payload = {
-            "type": "new_order",
-            "data": {
-                "id": 123,
-                "customer_name": "Test Customer",
-                "customer_email": "test@example.com",
-                "service_name": "FDM Printing",
-                "source": "TELEGRAM",
-                "specifications": {
-                    "telegram_user_id": 456789
-                }
-            },
-            "timestamp": "2024-01-01T12:00:00Z"
-        }
-        
-        resp = await self.client.request(
+    @pytest.mark.parametrize(
+        "body, expected_response, expected_calls",
+        [
+            (NEW_ORDER_BODY, NEW_ORDER_RESPONSE,
+             [("notify_new_orders_batch", ([(NEW_ORDER_PAYLOAD["data"], 456789)],), {})]),
+            (STATUS_CHANGE_BODY, STATUS_CHANGE_RESPONSE,
+             [("notify_status_change_by_email", ("test@example.com", STATUS_CHANGE_PAYLOAD["data"]), {})]),
+            (TEST_NOTIFICATION_BODY, TEST_NOTIFICATION_RESPONSE,
+             [("send_test_notification", (), {})]),
+        ],
+        ids=["new_order", "status_change", "test"]
+    )
+    async def test_handle_notification(self, client, notification_service, body,
+                                       expected_response, expected_calls):
+        """Test handling each notification type"""
+        resp = await client.request(
             "POST", 
             "/webhook/notifications",
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"}
+            data=body,
+            headers=JSON_HEADERS
         )
         
         assert resp.status == 200
         data = await resp.json()
-        assert data["success"] is True
-        assert "new_order" in data["message"]
+        assert data.pop("processed_at")
+        assert data == expected_response
         
-        # Verify notification service was called
-        self.mock_notification_service.notify_new_order.assert_called_once_with(
-            payload["data"], 456789
-        )
+        # Verify which notification service methods were called
+        assert notification_service.calls == expected_calls
     
-    @unittest_run_loop
-    async def test_handle_status_change_notification(self):
-        """Test handling status change notification"""
-        payload = {
-            "type": "status_change",
-            "data": {
-                "id": 123,
-                "customer_name": "Test Customer",
-                "customer_email": "test@example.com",
-                "service_name": "FDM Printing",
-                "status": "ready",
-                "source": "TELEGRAM"
-            },
-            "timestamp": "2024-01-01T12:00:00Z"
-        }
-        
-        resp = await self.client.request(
+    async def test_handle_oversized_payload(self, client, notification_service):
+        """Test that bodies above the configured size limit are rejected"""
+        resp = await client.request(
             "POST", 
             "/webhook/notifications",
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"}
+            data=b" " * (settings.webhook_max_body_size + 1),
+            headers=JSON_HEADERS
         )
         
-        assert resp.status == 200
-        data = await resp.json()
-        assert data["success"] is True
-        assert "status_change" in data["message"]
-        
-        # Verify notification service was called
-        self.mock_notification_service.notify_status_change_by_email.assert_called_once_with(
-            "test@example.com", payload["data"]
-        )
-    
-    @unittest_run_loop
-    async def test_handle_test_notification(self):
-        """Test handling test notification"""
-        payload = {
-            "type": "test",
-            "data": {
-                "message": "Test notification"
-            },
-            "timestamp": "2024-01-01T12:00:00Z"
-        }
-        
-        resp = await self.client.request(
-            "POST", 
-            "/webhook/notifications",
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"}
-        )
-        
-        assert resp.status == 200
-        data = await resp.json()
-        assert data["success"] is True
-        assert "test" in data["message"]
-        
-        # Verify notification service was called
-        self.mock_notification_service.send_test_notification.assert_called_once()
-    
-    @unittest_run_loop
-    async def test_handle_unknown_notification_type(self):
-        """Test handling unknown notification type"""
-        payload = {
-            "type": "unknown_type",
-            "data": {},
-            "timestamp": "2024-01-01T12:00:00Z"
-        }
-        
-        resp = await self.client.request(
-            "POST", 
-            "/webhook/notifications",
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"}
-        )
-        
-        assert resp.status == 400
-        data = await resp.json()
-        assert "error" in data
-        assert "unknown_type" in data["error"]
+        assert resp.status == 413
+        assert await resp.json() == PAYLOAD_TOO_LARGE_RESPONSE
+        assert notification_service.calls == []
     
-    @unittest_run_loop
-    async def test_handle_invalid_json(self):
-        """Test handling invalid JSON payload"""
-        resp = await self.client.request(
-            "POST", 
-            "/webhook/notifications",
-            data="invalid json",
-            headers={"Content-Type": "application/json"}
-        )
-        
-        assert resp.status == 400
-        data = await resp.json()
-        assert data["error"] == "Invalid JSON"
-    
-    @unittest_run_loop
-    async def test_handle_notification_service_error(self):
+    async def test_handle_notification_service_error(self, client, notification_service):
         """Test handling notification service errors"""
-        # Mock notification service to raise an exception
-        self.mock_notification_service.notify_new_order.side_effect = Exception("Service error")
+        # Make the notification service raise an exception
+        notification_service.error = Exception("Service error")
         
-        payload = {
-            "type": "new_order",
-            "data": {
-                "id": 123,
-                "customer_name": "Test Customer",
-                "source": "TELEGRAM"
-            },
-            "timestamp": "2024-01-01T12:00:00Z"
-        }
-        
-        resp = await self.client.request(
+        resp = await client.request(
             "POST", 
             "/webhook/notifications",
-            data=json.dumps(payload),
-            headers={"Content-Type": "application/json"}
+            data=SERVICE_ERROR_ORDER_BODY,
+            headers=JSON_HEADERS
         )
         
         assert resp.status == 500
-        data = await resp.json()
-        assert "error" in data
-        assert "Service error" in data["error"]
+        # The exception message stays in the log, out of the response
+        assert await resp.json() == INTERNAL_ERROR_RESPONSE
 
 
 class TestWebhookHandlerUnit:
     """Unit tests for WebhookHandler methods"""
     
-    @pytest.fixture
-    def webhook_handler(self):
-        """Create webhook handler for testing"""
-        mock_notification_service = AsyncMock(spec=NotificationService)
-        return WebhookHandler(mock_notification_service)
-    
-    @pytest.mark.asyncio
     async def test_handle_new_order_web_source(self, webhook_handler):
         """Test handling new order from web source"""
-        order_data = {
-            "id": 123,
-            "customer_name": "Test Customer",
-            "source": "WEB"
-        }
-        
-        await webhook_handler._handle_new_order(order_data)
+        await webhook_handler._handle_new_order(WEB_ORDER)
         
-        # Should call notify_new_order with user_id=0 for web orders
-        webhook_handler.notification_service.notify_new_order.assert_called_once_with(
-            order_data, 0
-        )
+        # Should notify about the order with user_id=0 for web orders
+        assert webhook_handler.notification_service.calls == [
+            ("notify_new_orders_batch", ([(WEB_ORDER, 0)],), {})
+        ]
     
-    @pytest.mark.asyncio
     async def test_handle_new_order_telegram_source(self, webhook_handler):
         """Test handling new order from Telegram source"""
-        order_data = {
-            "id": 123,
-            "customer_name": "Test Customer",
-            "source": "TELEGRAM",
-            "specifications": {
-                "telegram_user_id": 456789
-            }
-        }
-        
-        await webhook_handler._handle_new_order(order_data)
+        await webhook_handler._handle_new_order(TELEGRAM_ORDER)
         
-        # Should call notify_new_order with extracted user_id
-        webhook_handler.notification_service.notify_new_order.assert_called_once_with(
-            order_data, 456789
+        # Should notify about the order with extracted user_id
+        assert webhook_handler.notification_service.calls == [
+            ("notify_new_orders_batch", ([(TELEGRAM_ORDER, 456789)],), {})
+        ]
+    
+    async def test_handle_new_order_batches_concurrent_orders(self, webhook_handler):
+        """Test that orders arriving together are sent to admins in one batch"""
+        await asyncio.gather(
+            webhook_handler._handle_new_order(WEB_ORDER),
+            webhook_handler._handle_new_order(TELEGRAM_ORDER)
         )
+        
+        assert webhook_handler.notification_service.calls == [
+            ("notify_new_orders_batch", ([(WEB_ORDER, 0), (TELEGRAM_ORDER, 456789)],), {})
+        ]
     
-    @pytest.mark.asyncio
     async def test_handle_status_change_telegram_order(self, webhook_handler):
         """Test handling status change for Telegram order"""
-        order_data = {
-            "id": 123,
-            "customer_email": "test@example.com",
-            "source": "TELEGRAM",
-            "status": "ready"
-        }
-        
-        await webhook_handler._handle_status_change(order_data)
+        await webhook_handler._handle_status_change(TELEGRAM_STATUS_CHANGE)
         
         # Should call notify_status_change_by_email
-        webhook_handler.notification_service.notify_status_change_by_email.assert_called_once_with(
-            "test@example.com", order_data
-        )
+        assert webhook_handler.notification_service.calls == [
+            ("notify_status_change_by_email", ("test@example.com", TELEGRAM_STATUS_CHANGE), {})
+        ]
     
-    @pytest.mark.asyncio
     async def test_handle_status_change_web_order(self, webhook_handler):
         """Test handling status change for web order"""
-        order_data = {
-            "id": 123,
-            "customer_email": "test@example.com",
-            "source": "WEB",
-            "status": "ready"
-        }
-        
-        await webhook_handler._handle_status_change(order_data)
+        await webhook_handler._handle_status_change(WEB_STATUS_CHANGE)
         
         # Should not call notification service for web orders
-        webhook_handler.notification_service.notify_status_change_by_email.assert_not_called()
+        assert webhook_handler.notification_service.calls == []
+    
+    @pytest.mark.parametrize(
+        "body, expected_response",
+        [
+            (b"invalid json", INVALID_JSON_RESPONSE),
+            (UNKNOWN_TYPE_BODY, UNKNOWN_TYPE_RESPONSE),
+        ],
+        ids=["invalid_json", "unknown_type"]
+    )
+    async def test_handle_notification_rejected(self, webhook_handler, body, expected_response):
+        """Test payloads rejected with 400 before reaching the notification service"""
+        response = await _call_handler(webhook_handler, body)
+        
+        assert response.status == 400
+        assert json.loads(response.body) == expected_response
+        assert webhook_handler.notification_service.calls == []
+    
+    async def test_handle_notification_duplicate_delivery(self, webhook_handler):
+        """Test that a redelivered notification is acknowledged but not dispatched again"""
+        first = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        second = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        
+        assert (first.status, second.status) == (200, 200)
+        assert json.loads(second.body) == DUPLICATE_NEW_ORDER_RESPONSE
+        assert webhook_handler.notification_service.calls == [
+            ("notify_new_orders_batch", ([(NEW_ORDER_PAYLOAD["data"], 456789)],), {})
+        ]
+    
+    async def test_handle_notification_retry_after_failure(self, webhook_handler):
+        """Test that a delivery which failed is dispatched again when retried"""
+        webhook_handler.notification_service.error = Exception("Service error")
+        failed = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        webhook_handler.notification_service.error = None
+        retried = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        
+        assert (failed.status, retried.status) == (500, 200)
+        assert len(webhook_handler.notification_service.calls) == 2
+    
+    async def test_handle_notification_retry_while_in_flight(self, webhook_handler, monkeypatch):
+        """Test that a retry racing a failing first attempt is refused and can be retried again"""
+        release = asyncio.Event()
+        
+        async def failing_handler(data):
+            await release.wait()
+            raise Exception("Service error")
+        
+        monkeypatch.setitem(webhook_handler._dispatch, "new_order", failing_handler)
+        first = asyncio.create_task(_call_handler(webhook_handler, NEW_ORDER_BODY))
+        await asyncio.sleep(0)
+        concurrent = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        release.set()
+        failed = await first
+        monkeypatch.undo()
+        retried = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        
+        assert (concurrent.status, failed.status, retried.status) == (409, 500, 200)
+        assert json.loads(concurrent.body) == IN_PROGRESS_NEW_ORDER_RESPONSE
+        assert webhook_handler.notification_service.calls == [
+            ("notify_new_orders_batch", ([(NEW_ORDER_PAYLOAD["data"], 456789)],), {})
+        ]
+    
+    @pytest.mark.parametrize(
+        "signature, expected_status",
+        [
+            (hmac.new(b"s3cret", NEW_ORDER_BODY, hashlib.sha256).hexdigest(), 200),
+            (hmac.new(b"other", NEW_ORDER_BODY, hashlib.sha256).hexdigest(), 401),
+            (None, 401),
+            ("\udcff" * 64, 401),
+        ],
+        ids=["valid", "wrong_secret", "missing", "non_ascii"]
+    )
+    async def test_handle_notification_signature(self, webhook_handler, monkeypatch,
+                                                 signature, expected_status):
+        """Test that a configured secret admits only correctly signed bodies"""
+        monkeypatch.setattr(webhook_handler, "_webhook_secret", b"s3cret")
+        headers = {"X-Webhook-Signature": signature} if signature else {}
+        
+        response = await _call_handler(webhook_handler, NEW_ORDER_BODY, headers)
+        
+        assert response.status == expected_status
+        assert len(webhook_handler.notification_service.calls) == (expected_status == 200)
+    
+    async def test_handle_notification_overloaded(self, webhook_handler, monkeypatch):
+        """Test that requests beyond the in-flight limit are rejected with 429"""
+        monkeypatch.setattr(webhook_handler, "_inflight", asyncio.Semaphore(0))
+        
+        response = await _call_handler(webhook_handler, NEW_ORDER_BODY)
+        
+        assert response.status == 429
+        assert json.loads(response.body) == TOO_MANY_REQUESTS_RESPONSE
+        assert webhook_handler.notification_service.calls == []
     
-    @pytest.mark.asyncio
     async def test_handle_test_notification(self, webhook_handler):
         """Test handling test notification"""
-        test_data = {"message": "Test"}
-        
-        await webhook_handler._handle_test_notification(test_data)
+        await webhook_handler._handle_test_notification(TEST_MESSAGE)
         
         # Should call send_test_notification
-        webhook_handler.notification_service.send_test_notification.assert_called_once()
+        assert webhook_handler.notification_service.calls == [("send_test_notification", (), {})]
+    
+    async def test_stop_server_sends_pending_orders(self, webhook_handler):
+        """Test that orders waiting in the batch window are sent before shutdown"""
+        queued = asyncio.create_task(webhook_handler._handle_new_order(WEB_ORDER))
+        await asyncio.sleep(0)  # let the order join the pending batch
+        calls_at_cleanup = []
+        
+        async def cleanup():
+            calls_at_cleanup.extend(webhook_handler.notification_service.calls)
+        
+        await webhook_handler.stop_server(SimpleNamespace(cleanup=cleanup))
+        await queued
+        
+        assert calls_at_cleanup == [("notify_new_orders_batch", ([(WEB_ORDER, 0)],), {})]
 
 
 # Mock tests for webhook registration
 class TestWebhookRegistration:
     """Tests for webhook registration utility"""
     
-    @pytest.mark.asyncio
-    async def test_register_webhook_url_mock(self):
+    def test_register_webhook_url_mock(self):
         """Test webhook URL registration with mocking"""
         from webhook_handler import register_webhook_url
         
@@ -3,17 +3,111 @@ Webhook handler for receiving notifications from the backend API.
 """
 import logging
 import asyncio
-from typing import Dict, Any, Optional
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
 from aiohttp import web, ClientSession
 from datetime import datetime
 import json
 
+import orjson
+
 from config import settings
 from notification_service import NotificationService
 from subscription_manager import SubscriptionManager
 
 logger = logging.getLogger(__name__)
 
+# Success messages for the supported notification types
+_SUCCESS_MESSAGES = {
+    notification_type: f"Notification {notification_type} processed"
+    for notification_type in ("new_order", "status_change", "test")
+}
+
+# Backend deliveries are at-least-once; deliveries completed within the TTL
+# are acknowledged without being dispatched again
+_DEDUP_MAX_ENTRIES = 10_000
+_DEDUP_TTL_SECONDS = 600
+# Keys the body digest used when a delivery has no idempotency_key; the cache
+# lives in this process only, so a per-process key costs nothing and keeps
+# the digests unpredictable from outside
+_DEDUP_SALT = secrets.token_bytes(16)
+
+# New orders arriving within this window are sent to admins as one batch
+_ORDER_BATCH_WINDOW_SECONDS = 0.025
+
+# Header carrying the hex HMAC-SHA256 of the request body
+_SIGNATURE_HEADER = "X-Webhook-Signature"
+
+# Body of every 500 response; error details only go to the log
+_INTERNAL_ERROR_BODY = orjson.dumps({"error": "Failed to process notification"})
+
+# Health check body around its timestamp, serialized once
+_HEALTH_PREFIX = orjson.dumps({
+    "status": "healthy",
+    "service": "telegram_webhook_handler",
+})[:-1] + b',"timestamp":"'
+_HEALTH_SUFFIX = b'"}'
+
+# Second and ISO string of the last _now_iso() formatting
+_iso_second = -1
+_iso_text = ""
+
+
+def _now_iso() -> str:
+    """Current local time in ISO format at one-second resolution
+    
+    The string is only formatted again once the second changes, so bursts of
+    requests share one formatting.
+    
+    Returns:
+        ISO 8601 timestamp without fractional seconds
+    """
+    global _iso_second, _iso_text
+    second = int(time.time())
+    if second != _iso_second:
+        _iso_text = datetime.fromtimestamp(second).isoformat()
+        _iso_second = second
+    return _iso_text
+
+
+# Timestamp and bytes of the last _health_body() result
+_health_iso = ""
+_health_bytes = b""
+
+
+def _health_body() -> bytes:
+    """Health check body for the current second
+    
+    The timestamp is plain ASCII, so it is spliced between the prebuilt
+    prefix and suffix; the body is rebuilt only when the timestamp changes.
+    
+    Returns:
+        JSON body of the health check response
+    """
+    global _health_iso, _health_bytes
+    now = _now_iso()
+    if now != _health_iso:
+        _health_bytes = _HEALTH_PREFIX + now.encode() + _HEALTH_SUFFIX
+        _health_iso = now
+    return _health_bytes
+
+
+def _json_response(data: Dict[str, Any], status: int = 200) -> web.Response:
+    """Build a JSON response encoded with orjson
+    
+    Args:
+        data: Response payload
+        status: HTTP status code
+    
+    Returns:
+        aiohttp response with an application/json body
+    """
+    return web.Response(body=orjson.dumps(data), status=status, content_type='application/json')
+
 
 class WebhookHandler:
     """Handles incoming webhooks from the backend API"""
@@ -21,8 +115,29 @@ class WebhookHandler:
     def __init__(self, notification_service: NotificationService):
         self.notification_service = notification_service
         self.subscription_manager = SubscriptionManager()
-        self.app = web.Application()
+        self.app = web.Application(client_max_size=settings.webhook_max_body_size)
+        # Requests handled at once; more than this are answered with 429
+        self._inflight = asyncio.Semaphore(settings.webhook_max_concurrent_requests)
+        # Signature checks are skipped when no secret is configured
+        self._webhook_secret = settings.webhook_secret.encode()
+        # Delivery key -> monotonic time it was completed, oldest first
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        # Delivery keys currently being dispatched
+        self._processing: Set[str] = set()
+        # New orders waiting for the next batch, with the futures their
+        # requests are awaiting
+        self._pending_orders: List[Tuple[Dict[str, Any], int, asyncio.Future]] = []
+        self._order_flush: Optional[asyncio.Task] = None
+        # Notification type -> handler for its data
+        self._dispatch = {
+            "new_order": self._handle_new_order,
+            "status_change": self._handle_status_change,
+            "test": self._handle_test_notification,
+        }
         self._setup_routes()
+        # The routes are fixed; AppRunner.setup() would freeze the app anyway,
+        # freezing it here makes any later route change fail straight away
+        self.app.freeze()
         logger.info("Webhook handler initialized")
     
     def _setup_routes(self):
@@ -30,45 +145,137 @@ class WebhookHandler:
         self.app.router.add_post('/webhook/notifications', self.handle_notification)
         self.app.router.add_get('/webhook/health', self.health_check)
     
+    def _claim_delivery(self, key: str) -> bool:
+        """Mark a delivery key as in flight unless it was completed within the TTL
+        
+        Args:
+            key: Idempotency key of the delivery, not currently in flight
+        
+        Returns:
+            True if the delivery is new and should be dispatched
+        """
+        now = time.monotonic()
+        # Keys are never moved once stored, so expired ones are at the front
+        while self._seen:
+            oldest_key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < _DEDUP_TTL_SECONDS:
+                break
+            del self._seen[oldest_key]
+        
+        if key in self._seen:
+            return False
+        
+        self._processing.add(key)
+        return True
+    
+    def _complete_delivery(self, key: str):
+        """Remember an in-flight delivery key as successfully dispatched
+        
+        Args:
+            key: Idempotency key claimed by _claim_delivery
+        """
+        self._processing.discard(key)
+        self._seen[key] = time.monotonic()
+        if len(self._seen) > _DEDUP_MAX_ENTRIES:
+            self._seen.popitem(last=False)
+    
+    def _verify_sig(self, body: bytes, header_sig: Optional[str]) -> bool:
+        """Check the request body against its HMAC-SHA256 signature
+        
+        Args:
+            body: Raw request body
+            header_sig: Hex digest from the signature header, if any
+        
+        Returns:
+            True if the signature matches the configured secret
+        """
+        if not header_sig:
+            return False
+        expected = hmac.new(self._webhook_secret, body, hashlib.sha256).hexdigest()
+        # compare_digest raises on non-ASCII str; such a header can never be
+        # a hex digest, so it is rejected like any other mismatch
+        if not header_sig.isascii():
+            return False
+        return hmac.compare_digest(expected, header_sig)
+    
     async def handle_notification(self, request: web.Request) -> web.Response:
         """Handle incoming notification webhook"""
+        # Shed load instead of letting handlers pile up behind a burst
+        if self._inflight.locked():
+            logger.warning("Webhook notification rejected, too many requests in flight")
+            return _json_response({"error": "Too many requests"}, status=429)
+        
+        async with self._inflight:
+            return await self._process_notification(request)
+    
+    async def _process_notification(self, request: web.Request) -> web.Response:
+        """Read, verify and dispatch one notification webhook"""
         try:
-            # Parse JSON payload
-            payload = await request.json()
+            body = await request.read()
+            # Reject unsigned or forged requests before parsing anything
+            if self._webhook_secret and not self._verify_sig(body, request.headers.get(_SIGNATURE_HEADER)):
+                logger.warning("Webhook notification with invalid signature rejected")
+                return _json_response({"error": "Invalid signature"}, status=401)
+            
+            # Parse the raw body; orjson reads bytes directly, so the body is
+            # never decoded into an intermediate str
+            payload = orjson.loads(body)
             notification_type = payload.get('type')
             notification_data = payload.get('data', {})
             timestamp = payload.get('timestamp')
             
-            logger.info(f"Received webhook notification: {notification_type}")
-            
-            if notification_type == "new_order":
-                await self._handle_new_order(notification_data)
-            elif notification_type == "status_change":
-                await self._handle_status_change(notification_data)
-            elif notification_type == "test":
-                await self._handle_test_notification(notification_data)
-            else:
-                logger.warning(f"Unknown notification type: {notification_type}")
-                return web.json_response(
+            logger.info("Received webhook notification: %s", notification_type)
+            
+            handler = self._dispatch.get(notification_type)
+            if handler is None:
+                logger.warning("Unknown notification type: %s", notification_type)
+                return _json_response(
                     {"error": f"Unknown notification type: {notification_type}"},
                     status=400
                 )
             
-            return web.json_response({
+            delivery_key = (
+                payload.get('idempotency_key')
+                or hashlib.blake2b(body, digest_size=16, key=_DEDUP_SALT).hexdigest()
+            )
+            # A retry racing the first attempt is refused rather than
+            # acknowledged, so it can be retried again if that attempt fails
+            if delivery_key in self._processing:
+                logger.info("Webhook notification already in progress: %s", notification_type)
+                return _json_response(
+                    {"error": f"Notification {notification_type} is being processed"},
+                    status=409
+                )
+            if not self._claim_delivery(delivery_key):
+                logger.info("Duplicate webhook notification skipped: %s", notification_type)
+                return _json_response({
+                    "success": True,
+                    "message": f"Notification {notification_type} already processed"
+                })
+            
+            try:
+                await handler(notification_data)
+            except BaseException:
+                # Let the backend's retry of a failed delivery through
+                self._processing.discard(delivery_key)
+                raise
+            self._complete_delivery(delivery_key)
+            
+            return _json_response({
                 "success": True,
-                "message": f"Notification {notification_type} processed",
-                "processed_at": datetime.now().isoformat()
+                "message": _SUCCESS_MESSAGES[notification_type],
+                "processed_at": _now_iso()
             })
             
+        except web.HTTPRequestEntityTooLarge:
+            logger.warning("Webhook payload exceeds the body size limit")
+            return _json_response({"error": "Payload too large"}, status=413)
         except json.JSONDecodeError:
             logger.error("Invalid JSON in webhook payload")
-            return web.json_response({"error": "Invalid JSON"}, status=400)
-        except Exception as e:
-            logger.error(f"Error handling webhook notification: {e}")
-            return web.json_response(
-                {"error": f"Failed to process notification: {str(e)}"},
-                status=500
-            )
+            return _json_response({"error": "Invalid JSON"}, status=400)
+        except Exception:
+            logger.exception("Error handling webhook notification")
+            return web.Response(body=_INTERNAL_ERROR_BODY, status=500, content_type='application/json')
     
     async def _handle_new_order(self, order_data: Dict[str, Any]):
         """Handle new order notification"""
@@ -82,15 +289,53 @@ class WebhookHandler:
                 specs = order_data.get('specifications', {})
                 user_id = specs.get('telegram_user_id')
             
-            # Send notification to admins
-            await self.notification_service.notify_new_order(order_data, user_id or 0)
+            # Send notification to admins together with any orders that
+            # arrive within the batch window
+            await self._queue_new_order(order_data, user_id or 0)
             
-            logger.info(f"New order notification processed for order {order_data.get('id')}")
+            logger.info("New order notification processed for order %s", order_data.get('id'))
             
         except Exception as e:
-            logger.error(f"Error handling new order notification: {e}")
+            logger.error("Error handling new order notification: %s", e)
             raise
     
+    async def _queue_new_order(self, order_data: Dict[str, Any], user_id: int):
+        """Add a new order to the pending batch and wait until it is sent
+        
+        Args:
+            order_data: Order information from the webhook
+            user_id: Telegram user ID who created the order, 0 if unknown
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending_orders.append((order_data, user_id, future))
+        if self._order_flush is None:
+            self._order_flush = asyncio.create_task(self._flush_new_orders())
+        await future
+    
+    async def _flush_new_orders(self):
+        """Send the orders collected during the batch window in one call"""
+        await asyncio.sleep(_ORDER_BATCH_WINDOW_SECONDS)
+        batch, self._pending_orders = self._pending_orders, []
+        self._order_flush = None
+        
+        try:
+            await self.notification_service.notify_new_orders_batch(
+                [(order_data, user_id) for order_data, user_id, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+    
+    async def _drain_new_orders(self):
+        """Wait until every pending new order batch has been sent"""
+        while self._order_flush is not None:
+            await self._order_flush
+    
     async def _handle_status_change(self, order_data: Dict[str, Any]):
         """Handle order status change notification"""
         try:
@@ -104,10 +349,10 @@ class WebhookHandler:
                     order_data
                 )
             
-            logger.info(f"Status change notification processed for order {order_data.get('id')}")
+            logger.info("Status change notification processed for order %s", order_data.get('id'))
             
         except Exception as e:
-            logger.error(f"Error handling status change notification: {e}")
+            logger.error("Error handling status change notification: %s", e)
             raise
     
     async def _handle_test_notification(self, data: Dict[str, Any]):
@@ -116,24 +361,21 @@ class WebhookHandler:
             # Send test notification to admins
             if self.notification_service:
                 success = await self.notification_service.send_test_notification()
-                logger.info(f"Test notification sent: {success}")
+                logger.info("Test notification sent: %s", success)
             
         except Exception as e:
-            logger.error(f"Error handling test notification: {e}")
+            logger.error("Error handling test notification: %s", e)
             raise
     
     async def health_check(self, request: web.Request) -> web.Response:
         """Health check endpoint"""
-        return web.json_response({
-            "status": "healthy",
-            "service": "telegram_webhook_handler",
-            "timestamp": datetime.now().isoformat()
-        })
+        return web.Response(body=_health_body(), content_type='application/json')
     
     async def start_server(self, host: str = '0.0.0.0', port: int = 8081):
         """Start the webhook server"""
         try:
-            runner = web.AppRunner(self.app)
+            # No access log: every request already logs its notification type
+            runner = web.AppRunner(self.app, access_log=None)
             await runner.setup()
             
             site = web.TCPSite(runner, host, port)
@@ -149,6 +391,9 @@ class WebhookHandler:
     async def stop_server(self, runner: web.AppRunner):
         """Stop the webhook server"""
         try:
+            # Send orders still waiting in the batch window before the
+            # handlers awaiting them are shut down
+            await self._drain_new_orders()
             await runner.cleanup()
             logger.info("Webhook server stopped")
         except Exception as e: